@@ -2,12 +2,74 @@
 
 __all__ = ["index", "modules", "custom_doc_links", "git_url"]
 
-index = {"load_audio": "core.ipynb",
+index = {"make_corpus": "bench.ipynb",
+         "time_each": "bench.ipynb",
+         "peak_rss_mb": "bench.ipynb",
+         "bench_load_audio": "bench.ipynb",
+         "bench_chunking": "bench.ipynb",
+         "bench_augs": "bench.ipynb",
+         "bench_dataset": "bench.ipynb",
+         "bench_spectrograms": "bench.ipynb",
+         "BENCHMARKS": "bench.ipynb",
+         "get_meta": "bench.ipynb",
+         "run_benchmarks": "bench.ipynb",
+         "flatten": "bench.ipynb",
+         "compare_results": "bench.ipynb",
+         "main": "spectro_fu.ipynb",
+         "load_audio": "core.ipynb",
          "makedir": "core.ipynb",
+         "chunk_stream": "chunkadelic.ipynb",
+         "frame_audio": "chunkadelic.ipynb",
+         "ChunkSaver": "chunkadelic.ipynb",
          "blow_chunks": "chunkadelic.ipynb",
+         "finish_chunks": "chunkadelic.ipynb",
+         "save_kwargs": "chunkadelic.ipynb",
+         "get_writer": "spectro_fu.ipynb",
+         "get_saver": "chunkadelic.ipynb",
+         "params_hash": "chunkadelic.ipynb",
+         "record_done": "chunkadelic.ipynb",
+         "clear_chunks": "chunkadelic.ipynb",
+         "read_manifest": "chunkadelic.ipynb",
+         "is_done": "chunkadelic.ipynb",
+         "files_to_do": "chunkadelic.ipynb",
+         "load_part": "chunkadelic.ipynb",
+         "output_name": "chunkadelic.ipynb",
+         "delete_unrecorded_items": "chunkadelic.ipynb",
          "process_one_file": "spectro_fu.ipynb",
-         "main": "spectro_fu.ipynb",
+         "process_batch": "spectro_fu.ipynb",
+         "process_task": "spectro_fu.ipynb",
+         "StageTimer": "core.ipynb",
+         "enable_timings": "core.ipynb",
+         "timed": "core.ipynb",
+         "save_timings": "core.ipynb",
+         "load_timings": "core.ipynb",
+         "print_timings": "core.ipynb",
          "is_silence": "core.ipynb",
+         "silence_frame_size": "core.ipynb",
+         "chunk_levels": "core.ipynb",
+         "silence_mask": "core.ipynb",
+         "get_resampler": "core.ipynb",
+         "resample_batch": "core.ipynb",
+         "load_audio_batch": "core.ipynb",
+         "load_audio_window": "core.ipynb",
+         "stream_audio": "core.ipynb",
+         "to_pcm": "core.ipynb",
+         "from_pcm": "core.ipynb",
+         "ShardWriter": "core.ipynb",
+         "delete_shard_items": "core.ipynb",
+         "ShardReader": "core.ipynb",
+         "SHARD_REC": "core.ipynb",
+         "get_audio_info": "core.ipynb",
+         "FileIndex": "core.ipynb",
+         "get_audio_filenames": "core.ipynb",
+         "AUDIO_EXTS": "core.ipynb",
+         "StringTable": "core.ipynb",
+         "FileTable": "core.ipynb",
+         "FILE_REC": "core.ipynb",
+         "check_audio_file": "core.ipynb",
+         "BadFileList": "core.ipynb",
+         "estimate_duration": "core.ipynb",
+         "schedule_tasks": "core.ipynb",
          "PadCrop": "datasets.ipynb",
          "PhaseFlipper": "datasets.ipynb",
          "FillTheNoise": "datasets.ipynb",
@@ -16,20 +78,52 @@ index = {"load_audio": "core.ipynb",
          "Mono": "datasets.ipynb",
          "Stereo": "datasets.ipynb",
          "RandomGain": "datasets.ipynb",
+         "BatchAug": "datasets.ipynb",
+         "BatchPadCrop": "datasets.ipynb",
+         "BatchPhaseFlipper": "datasets.ipynb",
+         "BatchFillTheNoise": "datasets.ipynb",
+         "BatchRandPool": "datasets.ipynb",
+         "BatchNormInputs": "datasets.ipynb",
+         "BatchStereo": "datasets.ipynb",
+         "BatchRandomGain": "datasets.ipynb",
+         "BatchAugs": "datasets.ipynb",
+         "get_rank": "datasets.ipynb",
+         "balanced_split": "datasets.ipynb",
+         "worker_split": "datasets.ipynb",
+         "ShardSampler": "datasets.ipynb",
+         "audio_envelope": "datasets.ipynb",
+         "EnvelopeIndex": "datasets.ipynb",
+         "AudioCache": "datasets.ipynb",
          "MultiStemDataset": "datasets.ipynb",
+         "FileGroupBatchSampler": "datasets.ipynb",
+         "StreamingStemDataset": "datasets.ipynb",
+         "count_chunks": "datasets.ipynb",
+         "chunk_silence": "datasets.ipynb",
+         "ChunkIndex": "datasets.ipynb",
+         "ChunkDataset": "datasets.ipynb",
          "stf_up": "spectro_fu.ipynb",
+         "get_new_filename": "spectro_fu.ipynb",
+         "mel_features": "spectro_fu.ipynb",
+         "read_mel": "spectro_fu.ipynb",
+         "mel_up": "spectro_fu.ipynb",
          "embeddings_table": "viz.ipynb",
          "proj_pca": "viz.ipynb",
          "pca_point_cloud": "viz.ipynb",
          "print_stats": "viz.ipynb",
          "spectrogram_image": "viz.ipynb",
          "audio_spectrogram_image": "viz.ipynb",
+         "get_mel_transform": "viz.ipynb",
+         "power_to_db": "viz.ipynb",
+         "colormap_lut": "viz.ipynb",
+         "fast_spectrogram_image": "viz.ipynb",
+         "audio_spectrogram_images": "viz.ipynb",
          "tokens_spectrogram_image": "viz.ipynb",
          "plot_jukebox_embeddings": "viz.ipynb"}
 
-modules = ["chunkadelic.py",
+modules = ["bench.py",
+           "chunkadelic.py",
            "core.py",
-           "data.py",
+           "datasets.py",
            "spectro_fu.py",
            "viz.py"]
 
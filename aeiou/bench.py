@@ -0,0 +1,211 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/bench.ipynb (unless otherwise specified).
+
+__all__ = ['make_corpus', 'time_each', 'peak_rss_mb', 'bench_load_audio', 'bench_chunking', 'bench_augs',
+           'bench_dataset', 'bench_spectrograms', 'BENCHMARKS', 'get_meta', 'run_benchmarks', 'flatten',
+           'compare_results', 'main']
+
+# Cell
+import argparse
+import os
+import math
+import time
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+from types import SimpleNamespace
+import numpy as np
+import torch
+import torchaudio
+import aeiou
+from .core import load_audio, makedir, ShardWriter
+
+# Cell
+def make_corpus(
+    path:str,              # directory to put the files in
+    n_files=8,             # number of files
+    srs=[44100, 48000],    # sample rates, used in turn
+    seconds=[2, 10, 30],   # lengths in seconds, used in turn
+    channels=2,            # number of channels
+    seed=0,                # random seed
+    )->list:
+    "writes synthetic audio files for benchmarking and returns their filenames"
+    makedir(path)
+    g, filenames = torch.Generator().manual_seed(seed), []
+    for i in range(n_files):
+        sr, secs = srs[i % len(srs)], seconds[i % len(seconds)]
+        n = int(sr*secs)
+        t = torch.arange(n)/sr
+        freqs = 100 + 900*torch.rand(channels, 1, generator=g)
+        audio = 0.3*torch.sin(2*math.pi*freqs*t) + 0.05*torch.randn(channels, n, generator=g)
+        audio[:, n//3 : n//3 + n//10] = 0     # some silence, for --strip
+        filename = f'{path}/synth_{i:03d}_{sr}_{secs}s.wav'
+        torchaudio.save(filename, audio, sr)
+        filenames.append(filename)
+    return filenames
+
+
+def time_each(
+    fn,                    # function to time
+    items:list,            # fn gets called on each of these
+    warmup=1,              # extra calls (on the first items) before timing starts
+    )->dict:
+    "calls fn(item) for each item; returns latency percentiles in ms and calls/sec"
+    for item in items[:warmup]: fn(item)
+    times = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        times.append(time.perf_counter() - start)
+    t = np.array(times)*1000
+    return {'n':len(items), 'p50_ms':float(np.percentile(t, 50)), 'p90_ms':float(np.percentile(t, 90)),
+            'p99_ms':float(np.percentile(t, 99)), 'per_sec':float(1000*len(t)/t.sum())}
+
+
+def peak_rss_mb()->dict:
+    "peak resident memory so far (a high-water mark for the whole run, not per benchmark), of this process and of its (finished) children, in MB"
+    scale = 1/2**20 if platform.system() == 'Darwin' else 1/2**10   # ru_maxrss is bytes on macs, KB on linux
+    return {'self':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale,
+            'children':resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss*scale}
+
+# Cell
+def bench_load_audio(filenames, workdir, sr=48000, quick=False):
+    "load_audio latency & throughput, including resampling for files not at sr"
+    n_samples = sum(load_audio(f, sr=sr).shape[-1] for f in filenames)
+    r = time_each(lambda f: load_audio(f, sr=sr), filenames)
+    r['samples_per_sec'] = n_samples/len(filenames)*r['per_sec']
+    return r
+
+
+def bench_chunking(filenames, workdir, chunk_size=2**17, quick=False):
+    "blow_chunks files/sec writing chunk files, and writing shards"
+    from .chunkadelic import blow_chunks
+    audios = [load_audio(f) for f in filenames]   # just the chunking & writing, not the decoding
+    out = {}
+    for fmt in ['files', 'shards']:
+        path = f'{workdir}/chunks-{fmt}'
+        makedir(path)
+        writer = ShardWriter(path) if fmt == 'shards' else None
+        r = time_each(lambda i: blow_chunks(audios[i], f'{path}/{i}.wav', chunk_size, strip=True, writer=writer, verbose=False), list(range(len(audios))), warmup=0)
+        if writer is not None: writer.close()
+        out[fmt] = r
+    return out
+
+
+def bench_augs(filenames, workdir, sample_size=65536, batch_size=16, quick=False):
+    "MultiStemDataset's augmentations done per item, vs. with batch_augs (crop per item, the rest per batch), in examples/sec"
+    from .datasets import PadCrop, PhaseFlipper, Stereo, BatchAugs, BatchPhaseFlipper, BatchStereo
+    x = torch.rand(batch_size, 2, 3*sample_size)*2 - 1
+    crop = PadCrop(sample_size)
+    item_augs = torch.nn.Sequential(crop, PhaseFlipper(), Stereo())
+    batch_augs = BatchAugs(BatchPhaseFlipper(), BatchStereo())
+    n = 5 if quick else 50
+    per_item = time_each(lambda i: torch.stack([item_augs(a).clamp(-1, 1) for a in x]), list(range(n)))
+    batched = time_each(lambda i: batch_augs([(crop(a), '') for a in x]), list(range(n)))
+    for r in [per_item, batched]: r['examples_per_sec'] = r['per_sec']*batch_size
+    return {'per_item':per_item, 'batch':batched}
+
+
+def bench_dataset(filenames, workdir, sample_size=65536, batch_size=8, workers=[0, 2, 4], quick=False):
+    "MultiStemDataset single-item latency, and DataLoader examples/sec for various numbers of workers"
+    from .datasets import MultiStemDataset
+    global_args = SimpleNamespace(sample_size=sample_size, random_crop=True, sample_rate=48000, num_gpus=1,
+                                  cache_training_data=False, bad_file_list=None)
+    ds = MultiStemDataset([os.path.dirname(filenames[0])], global_args)
+    out = {'item':time_each(lambda i: ds[i], list(range(len(ds)))*(1 if quick else 4))}
+    n_batches = 4 if quick else 20
+    for w in workers:   # one long pass (sampling with replacement, however few files there are), so workers only start once
+        sampler = torch.utils.data.RandomSampler(ds, replacement=True, num_samples=batch_size*(n_batches + 1))
+        batches = iter(torch.utils.data.DataLoader(ds, batch_size=batch_size, num_workers=w, sampler=sampler))
+        next(batches)   # warm-up batch, so worker startup isn't counted
+        n_examples, start = 0, time.perf_counter()
+        for audio, names in batches: n_examples += len(names)
+        out[f'loader_{w}_workers'] = {'examples_per_sec':n_examples/(time.perf_counter() - start)}
+    return out
+
+
+def bench_spectrograms(filenames, workdir, quick=False):
+    "spectrogram images/sec, via matplotlib (audio_spectrogram_image) and batched (audio_spectrogram_images)"
+    from .viz import audio_spectrogram_image, audio_spectrogram_images
+    audios = [load_audio(f)[:, :48000*10] for f in filenames]
+    return {'matplotlib':time_each(lambda a: audio_spectrogram_image(a, justimage=True), audios),
+            'batched':time_each(lambda i: audio_spectrogram_images(audios), [0, 1] if quick else [0, 1, 2, 3])}
+
+BENCHMARKS = {'load_audio':bench_load_audio, 'chunking':bench_chunking, 'augs':bench_augs,
+              'dataset':bench_dataset, 'spectrograms':bench_spectrograms}
+
+# Cell
+def get_meta()->dict:
+    "versions & machine info to store with benchmark results"
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(aeiou.__file__), capture_output=True, text=True).stdout.strip()
+    except Exception as e:
+        commit = ''
+    return {'aeiou':aeiou.__version__, 'commit':commit, 'torch':torch.__version__, 'torchaudio':torchaudio.__version__,
+            'python':platform.python_version(), 'platform':platform.platform(), 'cpus':os.cpu_count(), 'time':time.time()}
+
+
+def run_benchmarks(
+    workdir=None,          # scratch directory for the corpus & outputs (default: a temporary one)
+    only=None,             # names of benchmarks to run (default: all of BENCHMARKS)
+    quick=False,           # smaller corpus & fewer repeats
+    workers=[0, 2, 4],     # DataLoader worker counts to try
+    print=print,
+    )->dict:
+    "makes a synthetic corpus and runs the benchmarks on it. returns {'meta':..., 'results':...}"
+    tmp = tempfile.TemporaryDirectory() if workdir is None else None
+    workdir = tmp.name if tmp is not None else workdir
+    filenames = make_corpus(f'{workdir}/corpus', n_files=4 if quick else 12, seconds=[1, 3, 5] if quick else [2, 10, 30])
+    results = {}
+    for name, fn in BENCHMARKS.items():
+        if only is not None and name not in only: continue
+        print(f"Running {name}...", flush=True)
+        kwargs = {'workers':workers} if name == 'dataset' else {}
+        try:
+            results[name] = fn(filenames, workdir, quick=quick, **kwargs)
+        except Exception as e:   # e.g. an optional dependency is missing; carry on with the rest
+            results[name] = {'error':repr(e)}
+    if tmp is not None: tmp.cleanup()
+    return {'meta':{**get_meta(), 'cumulative_peak_rss_mb':peak_rss_mb()}, 'results':results}
+
+
+def flatten(d:dict, prefix='')->dict:
+    "{'a':{'b':1}} -> {'a.b':1}"
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict): out.update(flatten(v, f'{prefix}{k}.'))
+        else: out[f'{prefix}{k}'] = v
+    return out
+
+
+def compare_results(
+    old:dict,              # results from run_benchmarks, e.g. of an earlier version
+    new:dict,              # results to compare with them
+    print=print,
+    ):
+    "prints the throughputs of new relative to old"
+    o, n = flatten(old['results']), flatten(new['results'])
+    print(f"{'benchmark':<50}{'old':>12}{'new':>12}{'new/old':>9}")
+    for k in n:
+        if k.endswith('per_sec') and isinstance(o.get(k), (int, float)) and o[k] > 0:
+            print(f"{k:<50}{o[k]:>12.1f}{n[k]:>12.1f}{n[k]/o[k]:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--out', default='aeiou-bench.json', help='File to save results in (JSON)')
+    parser.add_argument('--only', nargs='+', default=None, choices=list(BENCHMARKS.keys()), help='Just run these benchmarks (default: all)')
+    parser.add_argument('--quick', action='store_true', help='Smaller corpus & fewer repeats')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4], help='DataLoader worker counts to try')
+    parser.add_argument('--workdir', default=None, help='Scratch directory (default: a temporary one)')
+    parser.add_argument('--compare', default=None, help='Earlier results file to compare with')
+    args = parser.parse_args()
+
+    res = run_benchmarks(workdir=args.workdir, only=args.only, quick=args.quick, workers=args.workers)
+    with open(args.out, 'w') as f: json.dump(res, f, indent=1)
+    print(f"Saved results to {args.out}")
+    for k, v in flatten(res['results']).items():
+        if k.endswith('per_sec') or k.endswith('error'): print(f"  {k} = {v if isinstance(v, str) else round(v, 1)}")
+    if args.compare is not None:
+        with open(args.compare) as f: compare_results(json.load(f), res)
\ No newline at end of file
@@ -1,6 +1,9 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/chunkadelic.ipynb (unless otherwise specified).
 
-__all__ = ['load_audio', 'makedir', 'blow_chunks', 'process_one_file', 'main']
+__all__ = ['load_audio', 'makedir', 'chunk_stream', 'frame_audio', 'ChunkSaver', 'blow_chunks', 'finish_chunks',
+           'save_kwargs', 'get_writer', 'get_saver', 'params_hash', 'record_done', 'clear_chunks', 'read_manifest',
+           'is_done', 'files_to_do', 'load_part', 'output_name', 'delete_unrecorded_items', 'process_one_file',
+           'process_batch', 'process_task', 'main']
 
 # Cell
 import argparse
@@ -11,8 +14,16 @@ from functools import partial
 from tqdm.contrib.concurrent import process_map
 import torch
 import torchaudio
+import torch.nn.functional as F
+import numpy as np
 import math
-from .core import is_silence, load_audio, makedir
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .core import is_silence, silence_mask, silence_frame_size, load_audio, load_audio_batch, load_audio_window, stream_audio, makedir, ShardWriter, FileIndex, delete_shard_items, SHARD_REC
+from .core import schedule_tasks, estimate_duration, timed, enable_timings, save_timings, load_timings, print_timings
 
 # Cell
 
@@ -42,65 +53,406 @@ def makedir(
         pass
 '''
 
+def chunk_stream(
+    blocks,              # iterable of consecutive [channels, samples] blocks of audio (or just one tensor)
+    chunk_size:int,      # how big each audio chunk is, in samples
+    overlap=0.5,         # fraction of each chunk to overlap between hops
+    ):
+    "yields (i, chunk) for each chunk, keeping only the audio that's still needed for upcoming chunks"
+    if isinstance(blocks, torch.Tensor): blocks = [blocks]
+    hop = int(overlap * chunk_size)
+    buf, buf_start, start, i = None, 0, 0, 0  # buf holds audio from sample buf_start onward
+    for block in blocks:
+        buf = block if buf is None else torch.cat([buf, block], dim=-1)
+        while start + chunk_size <= buf_start + buf.shape[-1]:
+            yield i, buf[:, start-buf_start:start-buf_start+chunk_size]
+            start, i = start + hop, i + 1
+        drop = min(start - buf_start, buf.shape[-1])  # nothing before start is needed anymore
+        buf, buf_start = buf[:, drop:], buf_start + drop
+    if buf is None: return
+    end = buf_start + buf.shape[-1]
+    while start < end:  # needs zero padding on end
+        chunk = buf.new_zeros(buf.shape[0], chunk_size)
+        chunk[:, :end-start] = buf[:, start-buf_start:]
+        yield i, chunk
+        start, i = start + hop, i + 1
+
+
+def frame_audio(
+    audio:torch.tensor,  # [channels, samples] audio
+    chunk_size:int,      # how big each audio chunk is, in samples
+    overlap=0.5,         # fraction of each chunk to overlap between hops
+    )->torch.tensor:
+    "all of blow_chunks' chunks at once, as one [n_chunks, channels, chunk_size] strided view of the zero-padded audio"
+    hop = int(overlap * chunk_size)
+    n_chunks = math.ceil(audio.shape[-1]/hop)
+    padded_len = (n_chunks-1)*hop + chunk_size
+    audio = F.pad(audio, (0, max(0, padded_len - audio.shape[-1])))
+    return audio.unfold(-1, chunk_size, hop).transpose(0, 1)
+
+
+class ChunkSaver():
+    "encodes & writes chunks from a bounded pool of threads, so a worker can get on with decoding while its chunks are saved"
+    def __init__(self,
+        threads=4,          # number of writer threads
+        max_pending=64,     # most chunks waiting to be written; save() blocks beyond this
+        save_fn=None,       # function that does the saving (default: torchaudio.save)
+        ):
+        self.pool, self.save_fn = ThreadPoolExecutor(threads), save_fn or torchaudio.save
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.futures, self.pending = [], []   # chunks not yet claimed by when_done, and (futures, fn, name) of unfinished files
+
+    def save(self, *args, **kwargs):
+        "queues a chunk to be saved with save_fn(*args, **kwargs)"
+        self.slots.acquire()   # backpressure: wait for a free slot
+        fut = self.pool.submit(self.timed_save, *args, **kwargs)
+        fut.add_done_callback(lambda f: self.slots.release())
+        self.futures.append(fut)
+        self.poll()
+
+    def timed_save(self, filename, audio, *args, **kwargs):
+        with timed('save', audio.shape[-1]):
+            self.save_fn(filename, audio, *args, **kwargs)
+
+    def when_done(self,
+        fn,                 # called with no arguments once everything saved since the last when_done is written
+        name='',            # what to call this group of chunks in error messages
+        ):
+        "arranges for fn to be called (from this thread, in a later poll or flush) once the chunks saved so far are written"
+        self.pending.append((self.futures, fn, name))
+        self.futures = []
+        self.poll()
+
+    def poll(self, wait=False):
+        "calls fn for each finished group of chunks. if wait, waits for all of them"
+        while self.pending:
+            futures, fn, name = self.pending[0]
+            if not wait and not all(f.done() for f in futures): break   # keep things in order
+            self.pending.pop(0)
+            if any(f.exception() is not None for f in futures):
+                print(f"Error writing chunks for {name}. Skipping.", flush=True)
+            else:
+                fn()
+
+    def flush(self):
+        "waits for all queued chunks to be written"
+        self.when_done(lambda: None)
+        self.poll(wait=True)
+
+
 def blow_chunks(
-    audio:torch.tensor,  # long audio file to be chunked
+    audio:torch.tensor,  # long audio file to be chunked, or an iterable of consecutive blocks of it (see stream_audio)
     new_filename:str,    # stem of new filename(s) to be output as chunks
     chunk_size:int,      # how big each audio chunk is, in samples
     sr=48000,            # audio sample rate in Hz
     overlap=0.5,         # fraction of each chunk to overlap between hops
     strip=False,    # strip silence: chunks with max power in dB below this value will not be saved to files
-    thresh=-70      # threshold in dB for determining what counts as silence
+    thresh=-70,     # threshold in dB for determining what counts as silence
+    writer=None,    # optional ShardWriter; if given, chunks get packed into shards instead of written as separate files
+    rms_thresh=None,  # if stripping: chunks with RMS in dB below this value count as silence too
+    silent_frac=None, # if stripping: chunks with at least this fraction of silent (below thresh) frames count as silence too
+    first_chunk=0,  # number of the first chunk, if audio is just part of a file (see load_part)
+    n_chunks=None,  # if given, only do this many chunks
+    saver=None,     # optional ChunkSaver to write chunk files in the background. they're left as .tmp files; see finish_chunks
+    save_kw={},     # extra arguments for torchaudio.save, e.g. from save_kwargs
+    verbose=True,   # print a line for each silent chunk skipped
     ):
-    "chunks up the audio and saves them with --{i} on the end of each chunk filename"
-    chunk = torch.zeros(audio.shape[0], chunk_size)
+    "chunks up the audio and saves them with --{i} on the end of each chunk filename. returns list of chunks written, and number skipped"
     _, ext = os.path.splitext(new_filename)
+    written, n_skipped = [], 0
+    hop = int(overlap * chunk_size)
+    # a lone chunk would get frames of gcd(chunk_size, 1024) rather than gcd(chunk_size, hop, 1024), so fix them for both ways
+    silence_kw = dict(thresh=thresh, rms_thresh=rms_thresh, silent_frac=silent_frac, frame_size=silence_frame_size(chunk_size, hop))
 
-    start, i = 0, 0
-    while start < audio.shape[-1]:
+    if isinstance(audio, torch.Tensor):   # find the silent chunks for the whole file in one go
+        frames = frame_audio(audio, chunk_size, overlap=overlap)[:n_chunks]
+        with timed('silence', audio.shape[-1]):
+            silent = silence_mask(audio, chunk_size, hop, **silence_kw) if strip else torch.zeros(len(frames), dtype=torch.bool)
+        chunks = ((first_chunk+i, frames[i], silent[i]) for i in range(len(frames)))
+    else:                                 # streaming: one chunk at a time
+        chunks = ((first_chunk+i, chunk, strip and silence_mask(chunk, chunk_size, chunk_size, **silence_kw)[0])
+                  for i, chunk in chunk_stream(audio, chunk_size, overlap=overlap))
+
+    for i, chunk, is_silent in chunks:
         out_filename = new_filename.replace(ext, f'--{i}'+ext)
-        end = min(start + chunk_size, audio.shape[-1])
-        if end-start < chunk_size:  # needs zero padding on end
-            chunk = torch.zeros(audio.shape[0], chunk_size)
-        chunk[:,0:end-start] = audio[:,start:end]
-        if (not strip) or (not is_silence(chunk, thresh=thresh)):
-            torchaudio.save(out_filename, chunk, sr)
+        if not is_silent:
+            if writer is not None:
+                with timed('save', chunk.shape[-1]):
+                    written.append(writer.add(chunk, new_filename, part=i))
+            elif saver is not None:   # in the background. under a temporary name so no half-written chunks are ever visible
+                saver.save(out_filename+'.tmp', chunk, sr, format=ext[1:], **save_kw)
+                written.append(out_filename)
+            else:
+                with timed('save', chunk.shape[-1]):
+                    torchaudio.save(out_filename+'.tmp', chunk, sr, format=ext[1:], **save_kw)
+                written.append(out_filename)
         else:
-            print(f"skipping chunk {out_filename} because it's 'silent' (below threhold of {thresh} dB).",flush=True)
-        start, i = start + int(overlap * chunk_size), i + 1
-    return
+            if verbose: print(f"skipping chunk {out_filename} because it's 'silent' (below threhold of {thresh} dB).",flush=True)
+            n_skipped += 1
+    if writer is None and saver is None: finish_chunks(written)
+    return written, n_skipped
 
 
-def process_one_file(
-    filenames:list,      # list of filenames from which we'll pick one
+def finish_chunks(
+    written:list,   # chunk filenames, as returned by blow_chunks
+    ):
+    "gives written chunk files their real names, once they're all complete"
+    for out_filename in written: os.replace(out_filename+'.tmp', out_filename)
+
+
+def save_kwargs(args):
+    "extra torchaudio.save arguments for the --bits and --compression settings"
+    kw = {}
+    if args.bits is not None:
+        kw.update(encoding='PCM_F' if args.bits == 32 else 'PCM_S', bits_per_sample=args.bits)
+    if args.compression is not None: kw['compression'] = args.compression
+    return kw
+
+
+_writer = None  # one ShardWriter per worker process
+
+def get_writer(args):
+    "makes (once per process) the ShardWriter this worker will append its chunks to"
+    global _writer
+    if _writer is None:
+        _writer = ShardWriter(args.output_path, tag=os.getpid(), dtype=args.dtype, max_bytes=args.shard_size*2**20,
+                              meta={'sr':args.sr, 'chunk_size':args.chunk_size, 'overlap':args.overlap})
+    return _writer
+
+
+_saver = None  # one ChunkSaver per worker process
+
+def get_saver(args):
+    "makes (once per process) the ChunkSaver this worker will write its chunk files with. None if --write_threads is 0"
+    global _saver
+    if _saver is None and args.write_threads > 0:
+        _saver = ChunkSaver(threads=args.write_threads, max_pending=16*args.write_threads)
+    return _saver
+
+
+def params_hash(args):
+    "hash of the settings that affect what chunks come out of a file"
+    keys = ['chunk_size','sr','overlap','strip','thresh','rms_thresh','silent_frac','format','dtype','codec','bits','compression']
+    return hashlib.md5(json.dumps([getattr(args, k, None) for k in keys]).encode()).hexdigest()
+
+
+_manifest = None  # one manifest file per worker process
+
+def record_done(args, filename, stat, written, n_skipped, part=None):
+    "appends a line about a finished input file (or a part of one: (part, n_parts)) to this process's manifest file"
+    global _manifest
+    if _manifest is None:
+        makedir(f'{args.output_path}/.manifest')
+        _manifest = open(f'{args.output_path}/.manifest/{os.getpid()}.jsonl', 'a')
+    entry = {'file':filename, 'size':stat.st_size, 'mtime':stat.st_mtime, 'params':params_hash(args),
+             'chunks':written, 'skipped':n_skipped, 'time':time.time()}
+    if part is not None: entry['part'] = list(part)
+    _manifest.write(json.dumps(entry)+'\n')
+    _manifest.flush()
+    os.fsync(_manifest.fileno())
+
+
+def clear_chunks(
+    args,             # output of argparse
+    filename:str,     # input file
+    e:dict,           # its manifest entry, from read_manifest
+    ):
+    "deletes the chunks a previous run made from a file, and notes that in the manifest so none of its earlier entries count any more"
+    if args.format == 'shards':
+        delete_shard_items(args.output_path, e['chunks'])
+    else:
+        for c in e['chunks']:
+            if os.path.exists(c): os.remove(c)
+    makedir(f'{args.output_path}/.manifest')
+    with open(f'{args.output_path}/.manifest/resets.jsonl', 'a') as f:
+        f.write(json.dumps({'file':filename, 'reset':True, 'time':time.time()})+'\n')
+
+
+def read_manifest(output_path):
+    "dict of latest manifest entry for each input file processed in previous runs. entries for parts of a split-up file get merged"
+    entries = []
+    for mf in glob(f'{output_path}/.manifest/*.jsonl'):
+        with open(mf) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError as e:  # e.g. a line cut off by a crash
+                    pass
+    latest, keys = {}, ['size','mtime','params']
+    for e in sorted(entries, key=lambda e: e['time']):
+        if e.get('reset'):   # its chunks were deleted (see clear_chunks): start again
+            latest.pop(e['file'], None)
+            continue
+        prev = latest.get(e['file'])
+        if 'part' in e:   # file was split up: it's only done once all its parts are
+            part, n_parts = e.pop('part')
+            if prev is not None and prev.get('n_parts') == n_parts and [prev[k] for k in keys] == [e[k] for k in keys]:
+                e['chunks'], e['skipped'] = prev['chunks'] + e['chunks'], prev['skipped'] + e['skipped']
+                e['parts_done'] = prev['parts_done'] | {part}
+            else:
+                e['parts_done'] = {part}
+            e['n_parts'] = n_parts
+        latest[e['file']] = e
+    return latest
+
+
+def is_done(
+    e:dict,           # manifest entry for a file, from read_manifest
+    info:list,        # FileIndex info for the file
+    phash:str,        # params_hash for this run
+    )->bool:
+    "whether a previous run already chunked this version of the file with these settings"
+    return [e['size'], e['mtime'], e['params']] == info[:2] + [phash] and len(e.get('parts_done', [0])) == e.get('n_parts', 1)
+
+
+def files_to_do(
     args,                # output of argparse
-    file_ind             # index from filenames list to read from
+    file_index,          # FileIndex of the input files
+    )->list:
+    "indices of the files in file_index that aren't done yet, with whatever earlier runs left of them cleared out"
+    done, phash, todo = read_manifest(args.output_path), params_hash(args), []
+    for i, f in enumerate(file_index.filenames):
+        e = done.get(f)
+        if e is not None and is_done(e, file_index.info[f], phash): continue
+        if e is not None:   # changed or unfinished since last time: clear out its old chunks
+            clear_chunks(args, f, e)
+        todo.append(i)
+    if args.format == 'shards':   # a crash between committing a file's items & recording it leaves items the manifest doesn't know about
+        delete_unrecorded_items(args, [file_index.filenames[i] for i in todo])
+    return todo
+
+
+def load_part(
+    filename:str,        # file to load
+    args,                # output of argparse
+    part:int,            # which part to load
+    n_parts:int,         # number of parts the file is split into
     ):
-    "this chunks up one file"
-    filename = filenames[file_ind]  # this is actually input_path+/+filename
-    output_path, input_paths = args.output_path, args.input_paths
-    new_filename = None
+    "loads just the audio for one of n_parts ranges of a file's chunks. returns audio, number of its first chunk, and number of chunks"
+    info = torchaudio.info(filename)
+    if info.num_frames <= 0:   # length unknown: can't split it up, so part 0 does the whole thing
+        return (load_audio(filename, sr=args.sr), 0, None) if part == 0 else (None, 0, 0)
+    hop = int(args.overlap * args.chunk_size)
+    total = math.ceil(math.ceil(info.num_frames*args.sr/info.sample_rate)/hop)   # same as blow_chunks on the whole file
+    first, last = part*total//n_parts, (part+1)*total//n_parts
+    audio = load_audio_window(filename, first*hop, (last-first-1)*hop + args.chunk_size, sr=args.sr, in_sr=info.sample_rate)
+    return audio, first, last-first
 
-    for ipath in input_paths: # set up the output filename & any folders it needs
-        if args.nomix and ('Mix' in ipath) and ('Audio Files' in path): return  # this is specific to the BDCT dataset, otherwise ignore
+
+def output_name(
+    filename:str,        # input file
+    args,                # output of argparse
+    ):
+    "what a file's chunks get named after: its path under output_path, or for shards the name stored with its items. None if it's not in any input path"
+    for ipath in args.input_paths:
         if ipath in filename:
             last_ipath = ipath.split('/')[-1]           # get the last part of ipath
             clean_filename = filename.replace(ipath,'') # remove all of ipath from the front of filename
-            new_filename = f"{output_path}/{last_ipath}/{clean_filename}".replace('//','/')
-            makedir(os.path.dirname(new_filename))      # we might need to make a directory for the output file
-            break
+            if args.format == 'shards':                 # no per-file directories; store names relative to output_path
+                return f"{last_ipath}/{clean_filename}".replace('//','/')
+            new_filename = f"{args.output_path}/{last_ipath}/{clean_filename}".replace('//','/')
+            if args.codec is not None: new_filename = os.path.splitext(new_filename)[0] + '.' + args.codec
+            return new_filename
+    return None
+
+
+def delete_unrecorded_items(
+    args,                # output of argparse
+    filenames:list,      # input files about to be (re)done
+    ):
+    "marks deleted any shard items made from these files, including ones a crashed run committed but never got to record in the manifest"
+    names = {output_name(f, args) for f in filenames} - {None}
+    refs = []
+    for idx_file in glob(f'{args.output_path}/shard-*.idx'):
+        stem = idx_file[:-4]
+        with open(stem+'.names') as f: shard_names = f.read().split('\n')
+        recs = np.fromfile(idx_file, dtype=SHARD_REC)
+        refs += [(os.path.basename(stem), j) for j in np.flatnonzero([shard_names[n] in names for n in recs['name'].tolist()]).tolist()]
+    if len(refs) > 0: delete_shard_items(args.output_path, refs)
+
 
+def process_one_file(
+    filenames:list,      # list of filenames from which we'll pick one
+    args,                # output of argparse
+    file_ind,            # index from filenames list to read from
+    audio=None,          # audio for this file, if it's already been loaded (and resampled)
+    part=0,              # which part of the file to do, if it's split up
+    n_parts=1,           # number of parts the file is split into (see schedule_tasks)
+    ):
+    "this chunks up one file, or one part of it"
+    filename = filenames[file_ind]  # this is actually input_path+/+filename
+    for ipath in args.input_paths:
+        if args.nomix and ('Mix' in ipath) and ('Audio Files' in path): return  # this is specific to the BDCT dataset, otherwise ignore
+    new_filename = output_name(filename, args)
     if new_filename is None:
         print(f"ERROR: Something went wrong with name of input file {filename}. Skipping.",flush=True)
         return
+    if args.format != 'shards': makedir(os.path.dirname(new_filename))  # we might need to make a directory for the output file
+    writer = None
     try:
-        audio = load_audio(filename, sr=args.sr)
-        blow_chunks(audio, new_filename, args.chunk_size, sr=args.sr, overlap=args.overlap, strip=args.strip, thresh=args.thresh)
+        stat = os.stat(filename)   # before reading, so if it changes while we work we'll redo it next time
+        first_chunk, n_chunks = 0, None
+        if n_parts > 1:
+            audio, first_chunk, n_chunks = load_part(filename, args, part, n_parts)
+            if audio is None:
+                record_done(args, filename, stat, [], 0, part=(part, n_parts))
+                return
+        elif audio is None and args.stream:
+            audio = stream_audio(filename, sr=args.sr, block_size=args.chunk_size)
+        elif audio is None:
+            audio = load_audio(filename, sr=args.sr)
+        writer = get_writer(args) if args.format == 'shards' else None
+        saver = get_saver(args) if writer is None else None
+        written, n_skipped = blow_chunks(audio, new_filename, args.chunk_size, sr=args.sr, overlap=args.overlap, strip=args.strip, thresh=args.thresh,
+                    writer=writer, rms_thresh=args.rms_thresh, silent_frac=args.silent_frac, first_chunk=first_chunk, n_chunks=n_chunks,
+                    saver=saver, save_kw=save_kwargs(args))
+        if writer is not None: writer.commit()
+        done = partial(record_done, args, filename, stat, written, n_skipped, part=(part, n_parts) if n_parts > 1 else None)
+        if saver is None:
+            done()
+        else:   # carry on with the next file while this one's chunks get written
+            saver.when_done(lambda: (finish_chunks(written), done()), name=filename)
     except Exception as e:
         print(f"Error loading {filename} or writing chunks. Skipping.", flush=True)
+        if writer is not None: writer.discard()   # so its chunks so far don't get committed along with the next file's
 
     return
 
 
+def process_batch(
+    filenames:list,      # list of filenames from which we'll pick some
+    args,                # output of argparse
+    file_inds:list,      # indices of files in filenames, to be loaded & resampled together
+    ):
+    "chunks up several files, resampling them all in one batched call"
+    try:
+        audios = load_audio_batch([filenames[i] for i in file_inds], sr=args.sr)
+    except Exception as e:  # one bad file spoils the batch; let process_one_file sort it out
+        audios = [None]*len(file_inds)
+    for i, audio in zip(file_inds, audios):
+        process_one_file(filenames, args, i, audio=audio)
+    return
+
+
+def process_task(
+    filenames:list,      # list of filenames
+    args,                # output of argparse
+    task:list,           # (file index, part, n_parts) for each piece of work, as from schedule_tasks
+    ):
+    "does one scheduled task: some whole files (batched if --batch > 1) and/or parts of split-up files"
+    whole = [i for i, part, n_parts in task if n_parts == 1]
+    for j in range(0, len(whole), args.batch):
+        if args.batch > 1:
+            process_batch(filenames, args, whole[j:j+args.batch])
+        else:
+            process_one_file(filenames, args, whole[j])
+    for i, part, n_parts in task:
+        if n_parts > 1: process_one_file(filenames, args, i, part=part, n_parts=n_parts)
+    if _saver is not None: _saver.flush()   # everything's written & recorded before the task counts as finished
+    save_timings()
+    return
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--chunk_size', type=int, default=2**17, help='Length of chunks')
@@ -108,8 +460,21 @@ def main():
     parser.add_argument('--overlap', type=float, default=0.5, help='Overlap factor')
     parser.add_argument('--strip', action='store_true', help='Strips silence: chunks with max dB below <thresh> are not outputted')
     parser.add_argument('--thresh', type=int, default=-70, help='threshold in dB for determining what constitutes silence')
+    parser.add_argument('--rms_thresh', type=float, default=None, help='if stripping, chunks with RMS dB below this also count as silence')
+    parser.add_argument('--silent_frac', type=float, default=None, help='if stripping, chunks with at least this fraction of silent (below <thresh>) frames also count as silence')
     parser.add_argument('--workers', type=int, default=min(32, os.cpu_count() + 4), help='Maximum number of workers to use (default: all)')
     parser.add_argument('--nomix', action='store_true',  help='(BDCT Dataset specific) exclude output of "*/Audio Files/*Mix*"')
+    parser.add_argument('--format', default='files', choices=['files','shards'], help='Write each chunk as its own audio file, or pack chunks into big memory-mappable shards')
+    parser.add_argument('--dtype', default='float32', choices=['int16','float16','float32'], help='(shards only) storage data type for chunks')
+    parser.add_argument('--shard_size', type=int, default=1024, help='(shards only) approximate size of each shard file, in MB')
+    parser.add_argument('--stream', action='store_true', help='Decode files block-by-block instead of all at once, so long files fit in memory')
+    parser.add_argument('--batch', type=int, default=1, help='Load & resample this many files together in one batched call')
+    parser.add_argument('--task_secs', type=float, default=300, help='Seconds of audio per task: shorter files get grouped, longer ones split up. 0 = one file per task, in the order found')
+    parser.add_argument('--write_threads', type=int, default=4, help='(files only) threads per worker for encoding & writing chunks. 0 = write them in the worker itself')
+    parser.add_argument('--codec', default=None, choices=['wav','flac'], help='(files only) file type for chunks (default: same as the input file)')
+    parser.add_argument('--bits', type=int, default=None, choices=[16,24,32], help='(files only) bits per sample for chunks; 32 means floating point (default: depends on codec)')
+    parser.add_argument('--compression', type=float, default=None, help='(files only) compression level, e.g. 0 (fastest) to 8 (smallest) for flac')
+    parser.add_argument('--timings', default=None, help='Directory to save timings of each stage in, and print a summary at the end')
     parser.add_argument('output_path', help='Path of output for chunkified data')
     parser.add_argument('input_paths', nargs='+', help='Path(s) of a file or a folder of files. (recursive)')
     args = parser.parse_args()
@@ -118,15 +483,24 @@ def main():
     print(f"  chunk_size = {args.chunk_size}")
 
     print("Getting list of input filenames")
-    filenames = []
-    for path in args.input_paths:
-        for ext in ['wav','flac','ogg','aiff','aif','mp3']:
-            filenames += glob(f'{path}/**/*.{ext}', recursive=True)
+    file_index = FileIndex(args.input_paths)
+    filenames = file_index.filenames
     n = len(filenames)
     print(f"  Got {n} input filenames")
 
+    todo = files_to_do(args, file_index)
+    if len(todo) < n: print(f"  {n - len(todo)} files already done in a previous run")
+
     print("Processing files (in parallel)")
-    wrapper = partial(process_one_file, filenames, args)
-    r = process_map(wrapper, range(0, n), chunksize=1, max_workers=args.workers)  # different chunksize used by tqdm. max_workers is to avoid annoying other ppl
+    if args.task_secs > 0:   # biggest tasks first, so no worker is left grinding through a long file at the end
+        tasks = schedule_tasks([estimate_duration(file_index.info[filenames[i]]) for i in todo], target=args.task_secs)
+        tasks = [[(todo[k], part, n_parts) for k, part, n_parts in t] for t in tasks]
+    else:
+        tasks = [[(i, 0, 1) for i in todo[j:j+args.batch]] for j in range(0, len(todo), args.batch)]
+    print(f"  {len(tasks)} tasks")
+    if args.timings: enable_timings(args.timings, clear=True)
+    wrapper = partial(process_task, filenames, args)
+    r = process_map(wrapper, tasks, chunksize=1, max_workers=args.workers)  # workers grab the next task as soon as they're free. max_workers is to avoid annoying other ppl
+    if args.timings: print_timings(load_timings(args.timings))
 
     print("Finished")
\ No newline at end of file
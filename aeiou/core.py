@@ -1,6 +1,11 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/core.ipynb (unless otherwise specified).
 
-__all__ = ['is_silence', 'load_audio', 'makedir']
+__all__ = ['StageTimer', 'enable_timings', 'timed', 'save_timings', 'load_timings', 'print_timings', 'is_silence',
+           'silence_frame_size', 'chunk_levels', 'silence_mask', 'get_resampler', 'resample_batch', 'load_audio',
+           'load_audio_batch', 'load_audio_window', 'stream_audio', 'makedir', 'to_pcm', 'from_pcm', 'ShardWriter',
+           'delete_shard_items', 'ShardReader', 'SHARD_REC', 'get_audio_info', 'FileIndex', 'get_audio_filenames',
+           'AUDIO_EXTS', 'StringTable', 'FileTable', 'FILE_REC', 'check_audio_file', 'BadFileList', 'estimate_duration',
+           'schedule_tasks']
 
 # Cell
 import torch
@@ -12,6 +17,142 @@ import tqdm
 from pathlib import Path
 import yaml
 import os
+import math
+import json
+import hashlib
+from functools import lru_cache
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+import random
+from glob import glob
+import numpy as np
+from multiprocessing import Pool, cpu_count
+import multiprocessing.util
+
+# Cell
+class StageTimer():
+    "collects how long each stage takes (and how many samples/bytes it handles), for one process"
+    def __init__(self,
+        out_dir=None,        # where to save timings-<pid>.json; None = don't
+        max_samples=10000,   # most durations to keep per stage, for percentiles
+        save_every=10,       # seconds between saves
+        ):
+        self.out_dir, self.max_samples, self.save_every = out_dir, max_samples, save_every
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid, self.stats, self.last_save, self.unsaved = os.getpid(), {}, time.time(), False
+        if self.out_dir is not None:   # save once more when this process exits, e.g. a DataLoader worker that didn't live long enough to save
+            multiprocessing.util.Finalize(None, self.save, exitpriority=10)
+
+    def add(self, stage:str, secs:float, count=0):
+        "records one call of a stage"
+        now = time.time()
+        with self.lock:
+            if os.getpid() != self.pid: self.reset()   # we're a forked child: don't count the parent's numbers again
+            st = self.stats.get(stage)
+            if st is None: st = self.stats[stage] = {'n':0, 'secs':0.0, 'count':0, 'first':now-secs, 'last':now, 'samples':[]}
+            st['n'] += 1; st['secs'] += secs; st['count'] += count; st['last'] = now
+            self.unsaved = True
+            if len(st['samples']) < self.max_samples: st['samples'].append(secs)
+            else:   # reservoir sampling, so percentiles cover the whole run
+                j = random.randrange(st['n'])
+                if j < self.max_samples: st['samples'][j] = secs
+            due = self.out_dir is not None and now - self.last_save > self.save_every
+        if due: self.save()
+
+    @contextmanager
+    def time(self, stage:str, count=0):
+        "context manager that records how long its block takes. call .count(n) on what it gives you to set the count"
+        t = _Timing(count)
+        start = time.perf_counter()
+        try:
+            yield t
+        finally:
+            self.add(stage, time.perf_counter() - start, t.n)
+
+    def save(self):
+        "writes this process's numbers to out_dir, if there's anything new"
+        if self.out_dir is None or not self.unsaved: return
+        with self.lock:
+            self.last_save, self.unsaved = time.time(), False
+            data = json.dumps({'pid':self.pid, 'stats':self.stats})
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp = f'{self.out_dir}/timings-{self.pid}.json.tmp'
+        with open(tmp, 'w') as f: f.write(data)
+        os.replace(tmp, f'{self.out_dir}/timings-{self.pid}.json')
+
+    def merge(self, other:dict):
+        "adds another process's stats (as saved) into this one"
+        for stage, o in other.items():
+            st = self.stats.setdefault(stage, {'n':0, 'secs':0.0, 'count':0, 'first':o['first'], 'last':o['last'], 'samples':[]})
+            st['n'] += o['n']; st['secs'] += o['secs']; st['count'] += o['count']
+            st['first'], st['last'] = min(st['first'], o['first']), max(st['last'], o['last'])
+            st['samples'] += o['samples']
+
+    def summary(self)->dict:
+        "per stage: calls, total seconds, percentiles (ms), calls/sec and count/sec over the time the stage was active"
+        out = {}
+        for stage, st in self.stats.items():
+            q = np.percentile(np.array(st['samples'])*1000, [50, 90, 99]) if st['samples'] else [0, 0, 0]
+            span = max(st['last'] - st['first'], 1e-9)
+            out[stage] = {'n':st['n'], 'secs':st['secs'], 'p50_ms':q[0], 'p90_ms':q[1], 'p99_ms':q[2],
+                          'per_sec':st['n']/span, 'count':st['count'], 'count_per_sec':st['count']/span}
+        return out
+
+
+class _Timing():
+    "what timed() hands back, so a block can say how much it handled once it knows"
+    def __init__(self, n=0): self.n = n
+    def count(self, n): self.n = n
+
+_null_timing = nullcontext(_Timing())
+_timer = StageTimer(os.environ['AEIOU_TIMINGS']) if os.environ.get('AEIOU_TIMINGS') else None
+
+
+def enable_timings(
+    out_dir:str,      # directory for each process's timings file
+    clear=False,      # delete timings files left in out_dir from earlier runs
+    ):
+    "turns on timing for this process and any it starts later"
+    global _timer
+    if clear:
+        for fn in glob(f'{out_dir}/timings-*.json'): os.remove(fn)
+    os.environ['AEIOU_TIMINGS'] = out_dir   # so spawned processes do too
+    _timer = StageTimer(out_dir)
+    return _timer
+
+
+def timed(
+    stage:str,        # name of the stage, e.g. 'decode'
+    count=0,          # e.g. number of samples or bytes handled
+    ):
+    "context manager that records how long its block takes, if timings are enabled"
+    return _null_timing if _timer is None else _timer.time(stage, count)
+
+
+def save_timings():
+    "saves this process's timings now, e.g. at the end of a task"
+    if _timer is not None: _timer.save()
+
+
+def load_timings(
+    out_dir:str,      # directory the timings were saved in
+    )->StageTimer:
+    "adds up the timings saved by all the processes"
+    total = StageTimer()
+    for fn in glob(f'{out_dir}/timings-*.json'):
+        with open(fn) as f: total.merge(json.load(f)['stats'])
+    return total
+
+
+def print_timings(timer:StageTimer, print=print):
+    "prints a table of timings summary"
+    print(f"{'stage':<12}{'calls':>10}{'total s':>10}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'calls/s':>10}{'count/s':>12}")
+    for stage, s in sorted(timer.summary().items(), key=lambda kv: -kv[1]['secs']):
+        print(f"{stage:<12}{s['n']:>10}{s['secs']:>10.2f}{s['p50_ms']:>9.2f}{s['p90_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['per_sec']:>10.1f}{s['count_per_sec']:>12.0f}")
 
 # Cell
 def is_silence(
@@ -22,19 +163,180 @@ def is_silence(
     dBmax = 20*torch.log10(torch.flatten(audio.abs()).max()).cpu().numpy()
     return dBmax < thresh
 
+
+def silence_frame_size(
+    chunk_size:int,      # chunk length in samples
+    hop:int,             # samples between chunk starts
+    frame_size=1024,     # longest frame wanted
+    )->int:
+    "frame length used for silent_frac: the longest one up to frame_size that every chunk (start and end) lines up with"
+    return math.gcd(math.gcd(chunk_size, hop), frame_size)
+
+
+def chunk_levels(
+    audio:torch.tensor,  # [channels, samples] audio
+    chunk_size:int,      # chunk length in samples
+    hop:int,             # samples between chunk starts
+    thresh=-70,          # dB threshold below which a frame counts as silent
+    frame_size=1024,     # frame length for silent_frac; actually silence_frame_size(chunk_size, hop, frame_size)
+    ):
+    "peak dB, RMS dB and fraction of silent frames for every chunk position (as in blow_chunks, zero-padded at the end), all in one vectorized pass"
+    n, n_chunks = audio.shape[-1], math.ceil(audio.shape[-1]/hop)
+    b = silence_frame_size(chunk_size, hop, frame_size)
+    padded_len = (n_chunks-1)*hop + chunk_size
+    fix = lambda x: F.pad(x, (0, max(0, padded_len-n)))[:padded_len]
+    bpeak = fix(audio.abs().amax(0)).view(-1, b).amax(1)                 # per-frame peak, across channels
+    bsq = fix((audio.double()**2).sum(0)).view(-1, b).sum(1)             # per-frame sum of squares
+    win, step = chunk_size//b, hop//b
+    peak_db = 20*torch.log10(bpeak.unfold(0, win, step).amax(1))
+    rms_db = 10*torch.log10(bsq.unfold(0, win, step).sum(1)/(audio.shape[0]*chunk_size)).float()
+    silent_frac = (20*torch.log10(bpeak) < thresh).float().unfold(0, win, step).mean(1)
+    return peak_db, rms_db, silent_frac
+
+
+def silence_mask(
+    audio:torch.tensor,  # [channels, samples] audio
+    chunk_size:int,      # chunk length in samples
+    hop:int,             # samples between chunk starts
+    thresh=-70,          # chunks with peak below this many dB are silent (same as is_silence)
+    rms_thresh=None,     # if given, chunks with RMS below this many dB are silent too
+    silent_frac=None,    # if given, chunks with at least this fraction of silent frames are silent too
+    frame_size=1024,     # frame length for silent_frac
+    ):
+    "True for each chunk position that counts as silence"
+    peak_db, rms_db, frac = chunk_levels(audio, chunk_size, hop, thresh=thresh, frame_size=frame_size)
+    silent = peak_db < thresh
+    if rms_thresh is not None: silent |= rms_db < rms_thresh
+    if silent_frac is not None: silent |= frac >= silent_frac
+    return silent
+
+# Cell
+@lru_cache(maxsize=16)
+def get_resampler(
+    in_sr:int,            # input sample rate
+    out_sr:int,           # output sample rate
+    dtype=torch.float32,  # dtype of the audio to be resampled
+    **kwargs,             # quality settings passed to T.Resample, e.g. lowpass_filter_width, rolloff
+    ):
+    "memoized T.Resample: the kernel only gets computed once per (in_sr, out_sr, dtype, settings)"
+    return T.Resample(in_sr, out_sr, dtype=dtype, **kwargs)
+
+
+def resample_batch(
+    audios:list,      # list of [channels, samples] tensors, all at sample rate in_sr
+    in_sr:int,        # input sample rate
+    out_sr:int,       # output sample rate
+    **kwargs,         # quality settings passed to get_resampler
+    )->list:
+    "resamples several same-rate clips in one call by zero-padding them into one batch"
+    if in_sr == out_sr or len(audios) == 0: return audios
+    lengths = [a.shape[-1] for a in audios]
+    batch = torch.cat([F.pad(a, (0, max(lengths) - a.shape[-1])) for a in audios], dim=0)
+    batch = get_resampler(in_sr, out_sr, dtype=batch.dtype, **kwargs)(batch)
+    # resampling pads with zeros anyway, so cropping back gives the same result as resampling each separately
+    outs, c = [], 0
+    for a, n in zip(audios, lengths):
+        outs.append(batch[c:c+a.shape[0], :math.ceil(n*out_sr/in_sr)])
+        c += a.shape[0]
+    return outs
+
 # Cell
 def load_audio(
     filename:str,     # file to load
     sr=48000,         # sample rate to read/resample at
     )->torch.tensor:
     "this loads an audio file as a torch tensor"
-    audio, in_sr = torchaudio.load(filename)
+    with timed('decode') as t:
+        audio, in_sr = torchaudio.load(filename)
+        t.count(audio.shape[-1])
     if in_sr != sr:
         print(f"Resampling {filename} from {in_sr} Hz to {sr} Hz",flush=True)
-        resample_tf = T.Resample(in_sr, sr)
-        audio = resample_tf(audio)
+        with timed('resample', audio.shape[-1]):
+            audio = get_resampler(in_sr, sr, dtype=audio.dtype)(audio)
     return audio
 
+
+def load_audio_batch(
+    filenames:list,   # files to load
+    sr=48000,         # sample rate to read/resample at
+    )->list:
+    "loads several files, resampling all the ones that share a sample rate in a single batched call"
+    audios, in_srs = zip(*[torchaudio.load(f) for f in filenames])
+    out = list(audios)
+    for in_sr in set(in_srs):
+        if in_sr == sr: continue
+        inds = [i for i, s in enumerate(in_srs) if s == in_sr]
+        print(f"Resampling {len(inds)} file(s) from {in_sr} Hz to {sr} Hz",flush=True)
+        for i, a in zip(inds, resample_batch([out[i] for i in inds], in_sr, sr)): out[i] = a
+    return out
+
+
+def load_audio_window(
+    filename:str,     # file to load
+    start:int,        # first sample to return, at sample rate sr
+    length:int,       # number of samples to return, at sample rate sr
+    sr=48000,         # sample rate to read/resample at
+    in_sr=None,       # the file's sample rate, if already known (e.g. from a FileIndex)
+    margin=64,        # extra input samples to decode on each side, so resampler edge effects fall outside the window
+    )->torch.tensor:
+    "decodes only the part of a file needed for a window of audio, instead of the whole thing. may be shorter than length at the end of the file"
+    if in_sr is None: in_sr = torchaudio.info(filename).sample_rate
+    if in_sr == sr:
+        with timed('decode', length):
+            audio, _ = torchaudio.load(filename, frame_offset=start, num_frames=length)
+        return audio
+    g = math.gcd(in_sr, sr)
+    step_in, step_out = in_sr//g, sr//g   # input & output samples only line up every step_in input samples
+    read_start = max(0, start*in_sr//sr - margin) // step_in * step_in
+    read_end = math.ceil((start+length)*in_sr/sr) + margin
+    with timed('decode', read_end-read_start):
+        audio, _ = torchaudio.load(filename, frame_offset=read_start, num_frames=read_end-read_start)
+    with timed('resample', audio.shape[-1]):
+        audio = get_resampler(in_sr, sr, dtype=audio.dtype)(audio)
+    offset = start - read_start//step_in*step_out
+    return audio[:, offset:offset+length]
+
+
+def stream_audio(
+    filename:str,       # file to load
+    sr=48000,           # sample rate to read/resample at
+    block_size=2**18,   # number of samples (at rate sr) per block
+    margin=64,          # extra input samples kept on each side of a block, so resampler edge effects fall outside it
+    ):
+    "yields consecutive blocks of a file's resampled audio, reading through the file once and decoding only one block at a time"
+    import soundfile as sf
+    try:
+        f = sf.SoundFile(filename)
+    except RuntimeError:   # a format libsndfile can't read: no choice but to load it all
+        yield load_audio(filename, sr=sr)
+        return
+    with f:
+        def read(n):
+            with timed('decode') as t:
+                a = f.read(max(0, n), dtype='float32', always_2d=True)
+                t.count(len(a))
+            return torch.from_numpy(np.ascontiguousarray(a.T))
+        in_sr = f.samplerate
+        if in_sr == sr:
+            while True:
+                block = read(block_size)
+                if block.shape[-1] == 0: return
+                yield block
+        g = math.gcd(in_sr, sr)
+        step_in, step_out = in_sr//g, sr//g
+        n_out = math.ceil(f.frames*sr/in_sr)
+        buf, buf_start = read(0), 0   # the input from sample buf_start on, which is always a multiple of step_in
+        for start in range(0, n_out, block_size):   # the same windows as load_audio_window, but carried over instead of decoded again
+            length = min(block_size, n_out-start)
+            read_end = math.ceil((start+length)*in_sr/sr) + margin
+            buf = torch.cat([buf, read(read_end - buf_start - buf.shape[-1])], dim=-1)
+            with timed('resample', buf.shape[-1]):
+                out = get_resampler(in_sr, sr, dtype=buf.dtype)(buf)
+            offset = start - buf_start//step_in*step_out
+            yield out[:, offset:offset+length]
+            keep = max(0, (start+length)*in_sr//sr - margin) // step_in * step_in   # where the next block's window starts
+            buf, buf_start = buf[:, keep-buf_start:], keep
+
 # Cell
 def makedir(
     path:str,          # directory or nested directory
@@ -45,4 +347,442 @@ def makedir(
     try:
         os.makedirs(path)  # recursively make all dirs named in path
     except:                # don't really care about errors
-        pass
\ No newline at end of file
+        pass
+
+# Cell
+SHARD_REC = np.dtype([('offset','<i8'), ('rows','<i4'), ('cols','<i8'), ('name','<i4'), ('part','<i4')])  # one index record per item
+
+def to_pcm(
+    x:torch.tensor,   # float audio in [-1,1]
+    dtype='int16',    # storage dtype: int16, int24, float16 or float32
+    )->np.ndarray:
+    "converts float audio to a numpy array for storage, quantizing if dtype is an integer type. int24 comes out as an extra last axis of 3 little-endian bytes"
+    x = x.detach().cpu()
+    if dtype == 'int16': return (x.clamp(-1,1)*32767).round().to(torch.int16).numpy()
+    if dtype == 'int24':
+        q = (x.clamp(-1,1)*8388607).round().to(torch.int32).numpy().astype('<i4')
+        return q[..., None].view(np.uint8)[..., :3].copy()
+    return x.to(getattr(torch, dtype)).numpy()
+
+def from_pcm(
+    a:np.ndarray,     # stored array, as from to_pcm. slice it first to only dequantize part of it
+    )->torch.tensor:
+    "inverse of to_pcm: returns float32 torch tensor"
+    x = torch.from_numpy(a)
+    if x.dtype == torch.int16: return x.float()/32767
+    if x.dtype == torch.uint8 and x.shape[-1] == 3:   # int24
+        x = x.to(torch.int32)
+        x = x[..., 0] | (x[..., 1] << 8) | (x[..., 2] << 16)
+        return ((x << 8) >> 8).float()/8388607   # shifts sign-extend the 24-bit values
+    return x.float()
+
+
+class ShardWriter():
+    "appends 2D arrays to flat binary shard files with a compact fixed-size index"
+    def __init__(self,
+        path:str,           # directory to write shards in
+        prefix='shard',     # shard filename prefix
+        tag='',             # unique-per-writer string, e.g. process id, so parallel writers don't collide
+        dtype='int16',      # storage dtype: int16, float16 or float32
+        max_bytes=2**30,    # start a new shard once the current one gets bigger than this
+        meta={},            # extra info (e.g. sample rate) to store in <prefix>.json
+        ):
+        self.path, self.prefix, self.tag, self.dtype, self.max_bytes = path, prefix, tag, dtype, max_bytes
+        makedir(path)
+        meta_file = f'{path}/{prefix}.json'
+        if not os.path.exists(meta_file):   # every writer makes the same file, so it's ok if they race
+            tmp = f'{meta_file}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f: json.dump({'dtype':dtype, **meta}, f)
+            os.replace(tmp, meta_file)
+        self.k, self.files = 0, None
+        self.open_next()
+
+    def open_next(self):
+        "close the current shard (if any) and start a new one"
+        self.close()
+        while True:  # don't clobber shards from a previous run
+            stem = f'{self.path}/' + '-'.join(str(p) for p in [self.prefix, self.tag, f'{self.k:05d}'] if p != '')
+            if not os.path.exists(stem+'.bin'): break
+            self.k += 1
+        self.stem = stem
+        self.files = [open(stem+ext, 'ab') for ext in ['.bin','.idx','.names']]
+        self.n_names, self.nbytes, self.n_recs, self.pending = 0, 0, 0, []
+        self.last_name, self.name_bytes = None, 0
+        self.committed = (0, 0, None, 0)   # nbytes, n_names, last_name, name_bytes as of the last commit, for discard()
+
+    def add(self,
+        x:torch.tensor,   # [rows, cols] array to store, e.g. [channels, samples]
+        name:str,         # source name, e.g. the relative filename the item came from
+        part=0,           # part number within name, e.g. chunk index
+        ):
+        "store one item's data; it goes in the index at the next commit(). returns a reference to the item: (shard name, record number)"
+        binf, idxf, namef = self.files
+        if self.n_names == 0 or name != self.last_name:
+            line = (name.replace('\n',' ')+'\n').encode()
+            namef.write(line)
+            self.n_names, self.last_name, self.name_bytes = self.n_names + 1, name, self.name_bytes + len(line)
+        a = to_pcm(x, dtype=self.dtype)
+        if a.ndim != 2: a = a.reshape(-1, a.shape[-1])
+        offset = self.nbytes // a.itemsize
+        binf.write(a.tobytes())
+        self.nbytes += a.nbytes
+        self.pending.append((offset, a.shape[0], a.shape[1], self.n_names-1, part))
+        return (os.path.basename(self.stem), self.n_recs + len(self.pending) - 1)
+
+    def write_index(self):
+        "flush data, then add pending records to the index, so the index never points at unwritten data"
+        if len(self.pending) == 0: return
+        binf, idxf, namef = self.files
+        binf.flush(); namef.flush()
+        idxf.write(np.array(self.pending, dtype=SHARD_REC).tobytes())
+        idxf.flush()
+        self.n_recs, self.pending = self.n_recs + len(self.pending), []
+        self.committed = (self.nbytes, self.n_names, self.last_name, self.name_bytes)
+
+    def discard(self):
+        "drop everything added since the last commit, data and all, so readers never see it"
+        if len(self.pending) == 0: return
+        binf, idxf, namef = self.files
+        self.nbytes, self.n_names, self.last_name, self.name_bytes = self.committed
+        for f, size in [(binf, self.nbytes), (namef, self.name_bytes)]:
+            f.flush()
+            f.truncate(size)
+        self.pending = []
+
+    def commit(self):
+        "make everything added so far visible to readers. only starts new shards here, so a commit's items all land in one shard"
+        self.write_index()
+        if self.nbytes > self.max_bytes: self.open_next()
+
+    def close(self):
+        if self.files is not None:
+            self.write_index()
+            for f in self.files: f.close()
+        self.files = None
+
+
+def delete_shard_items(
+    path:str,           # directory containing shards
+    refs:list,          # item references, as returned by ShardWriter.add
+    prefix='shard',     # shard filename prefix
+    ):
+    "marks shard items as deleted, so ShardReaders skip them"
+    with open(f'{path}/{prefix}.deleted', 'a') as f:
+        f.write(''.join(f'{stem} {i}\n' for stem, i in refs))
+
+
+class ShardReader():
+    "memory-maps a directory of shards written by ShardWriter; reader[i] returns item i as a float tensor"
+    def __init__(self,
+        path:str,           # directory containing shards
+        prefix='shard',     # shard filename prefix
+        ):
+        self.path, self.prefix = path, prefix
+        with open(f'{path}/{prefix}.json') as f: self.meta = json.load(f)
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.stems = sorted(str(p)[:-4] for p in Path(path).glob(f'{prefix}-*.idx'))
+        recs = [np.fromfile(s+'.idx', dtype=SHARD_REC) for s in self.stems]
+        self.shard = np.concatenate([np.full(len(r), i, dtype=np.int32) for i, r in enumerate(recs)] or [np.zeros(0, dtype=np.int32)])
+        self.recs = np.concatenate(recs) if recs else np.zeros(0, dtype=SHARD_REC)
+        if os.path.exists(f'{path}/{prefix}.deleted'):   # drop items listed as deleted
+            starts = dict(zip((os.path.basename(s) for s in self.stems), np.cumsum([0]+[len(r) for r in recs])))
+            keep = np.ones(len(self.recs), dtype=bool)
+            with open(f'{path}/{prefix}.deleted') as f:
+                for line in f:
+                    stem, i = line.split()
+                    if stem in starts: keep[starts[stem] + int(i)] = False
+            self.shard, self.recs = self.shard[keep], self.recs[keep]
+        self.maps = None   # opened lazily, so that the reader can be sent to other processes cheaply
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['maps'] = None
+        return state
+
+    def __len__(self): return len(self.recs)
+
+    def raw(self, i):
+        "zero-copy numpy view of item i, in storage dtype"
+        if self.maps is None: self.maps = [None]*len(self.stems)
+        s = self.shard[i]
+        if self.maps[s] is None:   # mode 'c' = copy-on-write, so torch doesn't complain about read-only arrays
+            self.maps[s] = np.memmap(self.stems[s]+'.bin', dtype=self.dtype, mode='c')
+        rec = self.recs[i]
+        off, rows, cols = int(rec['offset']), int(rec['rows']), int(rec['cols'])
+        return self.maps[s][off:off+rows*cols].reshape(rows, cols)
+
+    def __getitem__(self, i):
+        return from_pcm(self.raw(i))
+
+    def name(self, i):
+        "source name and part number of item i"
+        s = self.shard[i]
+        if not hasattr(self, 'names'): self.names = {}
+        if s not in self.names:
+            with open(self.stems[s]+'.names') as f: self.names[s] = f.read().split('\n')
+        return self.names[s][self.recs[i]['name']], int(self.recs[i]['part'])
+
+# Cell
+AUDIO_EXTS = ['wav','flac','ogg','aiff','aif','mp3']
+
+def get_audio_info(
+    filename:str,    # audio file to probe
+    )->list:
+    "reads [sample_rate, channels, frames] from the file header without decoding; -1's if unreadable"
+    try:
+        info = torchaudio.info(filename)
+        return [info.sample_rate, info.num_channels, info.num_frames]
+    except Exception as e:
+        return [-1, -1, -1]
+
+
+class FileIndex():
+    "persistent, incrementally-refreshed index of all audio files under some paths"
+    def __init__(self,
+        paths:list,         # list of directories (or files) to index, recursively
+        exts=AUDIO_EXTS,    # file extensions to include
+        index_dir='~/.cache/aeiou',  # where to save index files; None = don't save
+        probe=True,         # read sample rate/channels/frames from each file's header
+        workers=None,       # number of processes for probing headers (default: all cpus)
+        verify=False,       # also stat every file in unchanged directories, to catch files rewritten in place
+        ):
+        self.exts, self.probe, self.workers, self.verify = tuple('.'+e for e in exts), probe, workers or cpu_count(), verify
+        self.info = {}      # filename -> [size, mtime, sample_rate, channels, frames]
+        for path in ([paths] if isinstance(paths, str) else paths):
+            self.info.update(self.index_path(path, index_dir))
+        self.filenames = list(self.info.keys())
+
+    def index_path(self, path, index_dir):
+        "index one tree, reusing & refreshing its saved index if there is one"
+        path = path.rstrip('/') if path != '/' else path
+        if os.path.isfile(path):
+            st = os.stat(path)
+            return {path: [st.st_size, st.st_mtime] + (get_audio_info(path) if self.probe else [-1]*3)} if path.endswith(self.exts) else {}
+        index_file = None
+        if index_dir is not None:
+            key = hashlib.md5(f'{os.path.abspath(path)}|{self.exts}|{self.probe}'.encode()).hexdigest()
+            index_file = f'{os.path.expanduser(index_dir)}/index-{key}.json'
+        old = {}
+        if index_file and os.path.exists(index_file):
+            try:
+                with open(index_file) as f: old = json.load(f)
+            except Exception as e:
+                old = {}
+        dirs, to_probe = {}, []
+        self.scan(path, old, dirs, to_probe)
+        if self.probe and len(to_probe) > 0:
+            filenames = [f'{d}/{dirs[d]["files"][i][0]}' for d, i in to_probe]
+            with Pool(processes=min(self.workers, len(filenames))) as p:
+                infos = list(tqdm.tqdm(p.imap(get_audio_info, filenames, chunksize=64), total=len(filenames), desc=f'Indexing {path}', disable=len(filenames) < 1000))
+            for (d, i), info in zip(to_probe, infos): dirs[d]['files'][i][3:] = info
+        if index_file:
+            makedir(os.path.dirname(index_file))
+            tmp = f'{index_file}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f: json.dump(dirs, f)
+            os.replace(tmp, index_file)
+        return {f'{d}/{entry[0]}': entry[1:] for d in dirs for entry in dirs[d]['files']}
+
+    def scan(self, d, old, dirs, to_probe):
+        "walk directory d (recursively), only listing it again if its mtime changed since the old index"
+        try:
+            mtime = os.stat(d).st_mtime
+        except OSError as e:
+            return
+        if d in old and old[d]['mtime'] == mtime and not self.verify:  # nothing added/removed/renamed here: reuse it as is
+            dirs[d] = old[d]
+            for sd in old[d]['subdirs']: self.scan(f'{d}/{sd}', old, dirs, to_probe)
+            return
+        if d in old and old[d]['mtime'] == mtime:  # files could still have been rewritten in place, so stat them
+            files, subdirs = old[d]['files'], old[d]['subdirs']
+        else:
+            files, subdirs = [], []
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_dir(): subdirs.append(entry.name)
+                    elif entry.name.endswith(self.exts): files.append([entry.name])
+            files.sort(), subdirs.sort()
+        prev = {f[0]: f for f in old[d]['files']} if d in old else {}
+        entries = []
+        for f in files:
+            try:
+                st = os.stat(f'{d}/{f[0]}')
+            except OSError as e:
+                continue
+            p = prev.get(f[0])
+            if p is not None and p[1] == st.st_size and p[2] == st.st_mtime:
+                entries.append(p)
+            else:
+                entries.append([f[0], st.st_size, st.st_mtime, -1, -1, -1])
+                to_probe.append((d, len(entries)-1))
+        dirs[d] = {'mtime': mtime, 'files': entries, 'subdirs': subdirs}
+        for sd in subdirs: self.scan(f'{d}/{sd}', old, dirs, to_probe)
+
+
+def get_audio_filenames(
+    paths:list,    # directories to search (recursively)
+    exts=AUDIO_EXTS, # file extensions to include
+    **kwargs,      # passed on to FileIndex
+    )->list:
+    "list of all audio files under paths, via a persistent FileIndex"
+    return FileIndex(paths, exts=exts, **kwargs).filenames
+
+# Cell
+def _hash64(b:bytes)->int:
+    return int.from_bytes(hashlib.blake2b(b, digest_size=8).digest(), 'little', signed=True)
+
+
+class StringTable():
+    "read-only list of strings, packed into numpy arrays so that there are no per-string python objects"
+    def __init__(self,
+        strings,           # iterable of str
+        ):
+        encoded = [x.encode() for x in strings]
+        self.offsets = np.zeros(len(encoded)+1, dtype=np.int64)   # string i is data[offsets[i]:offsets[i+1]]
+        np.cumsum([len(b) for b in encoded], out=self.offsets[1:])
+        self.data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        hashes = np.array([_hash64(b) for b in encoded], dtype=np.int64)
+        self.order = np.argsort(hashes, kind='stable')   # for index()
+        self.hashes = hashes[self.order]
+
+    def __len__(self): return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        "string i, or a new StringTable for a slice or array of indices"
+        if isinstance(i, slice): return StringTable(self[j] for j in range(*i.indices(len(self))))
+        if isinstance(i, (list, np.ndarray)): return StringTable(self[j] for j in i)
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError('StringTable index out of range')
+        return self.data[self.offsets[i]:self.offsets[i+1]].tobytes().decode()
+
+    def __iter__(self): return (self[i] for i in range(len(self)))
+
+    def index(self, x:str)->int:
+        "position of x, like list.index"
+        h = _hash64(x.encode())
+        lo, hi = np.searchsorted(self.hashes, h, side='left'), np.searchsorted(self.hashes, h, side='right')
+        for j in self.order[lo:hi]:
+            if self[j] == x: return int(j)
+        raise ValueError(f'{x!r} is not in the table')
+
+    def __contains__(self, x):
+        try:
+            self.index(x)
+            return True
+        except ValueError as e:
+            return False
+
+
+FILE_REC = np.dtype([('size','<i8'), ('mtime','<f8'), ('sample_rate','<i4'), ('channels','<i4'), ('frames','<i8')])  # FileIndex info
+
+class FileTable():
+    "compact, read-only copy of (some of) a FileIndex: .filenames is a StringTable and .info[filename] a record from a numpy array"
+    def __init__(self,
+        filenames,         # list or StringTable of filenames, e.g. FileIndex.filenames
+        info:dict,         # filename -> [size, mtime, sample_rate, channels, frames], e.g. FileIndex.info
+        ):
+        self.filenames = filenames if isinstance(filenames, StringTable) else StringTable(filenames)
+        self.recs = np.array([tuple(info[f]) for f in self.filenames], dtype=FILE_REC)   # same order as filenames
+
+    @property
+    def info(self): return self   # so that file_table.info[filename] works like FileIndex.info[filename]
+
+    def __len__(self): return len(self.recs)
+
+    def __getitem__(self, filename:str)->tuple:
+        "(size, mtime, sample_rate, channels, frames) of filename"
+        return self.recs[self.filenames.index(filename)].tolist()
+
+# Cell
+def check_audio_file(
+    filename:str,    # audio file to check
+    n_frames=4096,   # how much of it to decode
+    ):
+    "tries decoding the start of a file. returns None if it's ok, else the error message"
+    try:
+        audio, sr = torchaudio.load(filename, num_frames=n_frames)
+        if audio.numel() == 0: return 'no audio'
+        return None
+    except Exception as e:
+        return repr(e)
+
+
+class BadFileList():
+    "persistent list of files that failed to load, shared by every process that uses the same path"
+    def __init__(self,
+        path='~/.cache/aeiou/bad_files.tsv',  # file to keep the list in; None = just in memory
+        ):
+        self.path = None if path is None else os.path.expanduser(path)
+        self.bad, self.counts = {}, {'failed':0, 'skipped':0}   # counts are for this process
+        self.reload()
+
+    def reload(self):
+        "reads entries other processes have added, ignoring ones for files that have changed since"
+        if self.path is None or not os.path.exists(self.path): return
+        with open(self.path) as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) < 3 or parts[2] in self.bad: continue
+                try:
+                    st = os.stat(parts[2])
+                    if [str(st.st_size), repr(st.st_mtime)] == parts[:2]: self.bad[parts[2]] = parts[3] if len(parts) > 3 else ''
+                except OSError as e:   # file's gone
+                    pass
+
+    def add(self,
+        filename:str,     # file that failed
+        reason='',        # e.g. the error message
+        ):
+        "records a file as bad, for this process and (via the file) everyone else"
+        if filename in self.bad: return
+        self.bad[filename] = reason
+        self.counts['failed'] += 1
+        if self.path is None: return
+        try:
+            st = os.stat(filename)
+            makedir(os.path.dirname(self.path))
+            line = '\t'.join([str(st.st_size), repr(st.st_mtime), filename, ' '.join(str(reason).split())]) + '\n'
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)   # a single small append won't interleave with other writers'
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+        except OSError as e:
+            pass
+
+    def __contains__(self, filename): return filename in self.bad
+
+    def __len__(self): return len(self.bad)
+
+# Cell
+def estimate_duration(
+    info:list,        # FileIndex info for a file: [size, mtime, sample_rate, channels, frames]
+    bytes_per_sec=192000,  # guess for files whose header couldn't be read (16-bit stereo 48kHz)
+    )->float:
+    "duration of a file in seconds, from its header if possible, or else guessed from its size"
+    size, mtime, sr, ch, frames = info
+    if sr > 0 and frames > 0: return frames/sr
+    return size/bytes_per_sec
+
+
+def schedule_tasks(
+    costs:list,          # cost of each item, e.g. duration in seconds
+    target=600,          # aim for tasks about this big
+    split=True,          # split items bigger than 2*target into parts
+    max_group=256,       # most items to group into one task
+    )->list:
+    "plans tasks for a process pool, biggest first. each task is a list of (item, part, n_parts)"
+    tasks, group, group_cost = [], [], 0
+    for i in sorted(range(len(costs)), key=lambda i: -costs[i]):
+        c = costs[i]
+        if split and c > 2*target:
+            n_parts = math.ceil(c/target)
+            tasks += [(c/n_parts, [(i, j, n_parts)]) for j in range(n_parts)]
+        elif c >= target:
+            tasks.append((c, [(i, 0, 1)]))
+        else:
+            group.append((i, 0, 1)); group_cost += c
+            if group_cost >= target or len(group) >= max_group:
+                tasks.append((group_cost, group))
+                group, group_cost = [], 0
+    if group: tasks.append((group_cost, group))
+    return [t for c, t in sorted(tasks, key=lambda t: -t[0])]
\ No newline at end of file
@@ -1,12 +1,17 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/datasets.ipynb (unless otherwise specified).
 
 __all__ = ['PadCrop', 'PhaseFlipper', 'FillTheNoise', 'RandPool', 'NormInputs', 'Mono', 'Stereo', 'RandomGain',
-           'MultiStemDataset']
+           'BatchAug', 'BatchPadCrop', 'BatchPhaseFlipper', 'BatchFillTheNoise', 'BatchRandPool', 'BatchNormInputs',
+           'BatchStereo', 'BatchRandomGain', 'BatchAugs', 'get_rank', 'balanced_split', 'worker_split', 'ShardSampler',
+           'audio_envelope', 'EnvelopeIndex', 'AudioCache', 'MultiStemDataset', 'FileGroupBatchSampler',
+           'StreamingStemDataset', 'count_chunks', 'chunk_silence', 'ChunkIndex', 'ChunkDataset']
 
 # Cell
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torchaudio
+import numpy as np
 from os import makedirs
 from torchaudio import transforms as T
 import random
@@ -15,6 +20,17 @@ import os
 import tqdm
 from multiprocessing import Pool, cpu_count, Barrier
 from functools import partial
+import time
+import math
+import hashlib
+import socket
+import fcntl
+import heapq
+import copy
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .core import ShardWriter, ShardReader, FileIndex, to_pcm, from_pcm, get_resampler, load_audio_batch, load_audio_window, estimate_duration
+from .core import StringTable, FileTable, BadFileList, check_audio_file, timed, load_audio, silence_mask, chunk_levels
 
 # Cell
 class PadCrop(nn.Module):
@@ -103,12 +119,387 @@ class RandomGain(nn.Module):
         signal = signal * gain
         return signal
 
+# Cell
+class BatchAug(nn.Module):
+    "base class for augmentations of whole [B, C, T] batches, with their own seedable RNG"
+    def __init__(self, seed=None):
+        super().__init__()
+        self.seed, self.gens = seed, {}
+
+    def reseed(self, seed): # e.g. seed + epoch
+        self.seed, self.gens = seed, {}
+
+    def rand(self, *shape, device='cpu'):
+        "uniform random numbers in [0,1) from this aug's generator for the given device (and worker)"
+        worker = torch.utils.data.get_worker_info()
+        key = (str(device), 0 if worker is None else worker.id)
+        if key not in self.gens:
+            g = torch.Generator(device=device)
+            if self.seed is None: g.seed()
+            else: g.manual_seed(self.seed + key[1])
+            self.gens[key] = g
+        return torch.rand(*shape, generator=self.gens[key], device=device)
+
+
+class BatchPadCrop(BatchAug):
+    "PadCrop for batches: gathers a window starting at a different random offset for each example"
+    def __init__(self, n_samples, randomize=True, seed=None):
+        super().__init__(seed=seed)
+        self.n_samples, self.randomize = n_samples, randomize
+
+    def __call__(self, signal, lengths=None): # lengths: [B] valid lengths, if examples were zero-padded to a common length
+        b, c, s = signal.shape
+        if lengths is None: lengths = torch.full((b,), s, device=signal.device)
+        max_start = (lengths - self.n_samples).clamp(min=0)
+        start = (self.rand(b, device=signal.device)*(max_start+1)).long() if self.randomize else torch.zeros_like(max_start)
+        inds = start[:,None] + torch.arange(self.n_samples, device=signal.device)[None,:]    # [B, n_samples]
+        valid = inds < lengths[:,None]
+        out = torch.gather(signal, 2, inds.clamp(max=s-1)[:,None,:].expand(b, c, -1))
+        return out * valid[:,None,:]
+
+
+class BatchPhaseFlipper(BatchAug):
+    "PhaseFlipper for batches"
+    def __init__(self, p=0.5, seed=None):
+        super().__init__(seed=seed)
+        self.p = p
+    def __call__(self, signal):
+        flip = self.rand(signal.shape[0], device=signal.device) < self.p
+        return signal * (1 - 2*flip.to(signal.dtype))[:,None,None]
+
+
+class BatchFillTheNoise(BatchAug):
+    "FillTheNoise for batches"
+    def __init__(self, p=0.33, seed=None):
+        super().__init__(seed=seed)
+        self.p = p
+    def __call__(self, signal):
+        b = signal.shape[0]
+        amp = 0.25*self.rand(b, device=signal.device) * (self.rand(b, device=signal.device) < self.p)
+        return signal + amp[:,None,None].to(signal.dtype)*(2*self.rand(*signal.shape, device=signal.device).to(signal.dtype)-1)
+
+
+class BatchRandPool(BatchAug):
+    "RandPool for batches: moving average with a different random kernel size per example, via cumulative sums. keeps the length the same"
+    def __init__(self, p=0.2, maxkern=100, seed=None):
+        super().__init__(seed=seed)
+        self.p, self.maxkern = p, maxkern
+    def __call__(self, signal):
+        b, c, s = signal.shape
+        k = 1 + (self.rand(b, device=signal.device)*(self.maxkern-1)).long()    # kernel size, 1..maxkern-1
+        k = torch.where(self.rand(b, device=signal.device) < self.p, k, torch.ones_like(k))   # k=1 means leave it alone
+        padded = F.pad(signal.double(), (self.maxkern+1, self.maxkern))
+        csum = torch.cumsum(padded, dim=-1)
+        t = torch.arange(s, device=signal.device)[None,:] + self.maxkern - k[:,None]//2    # window [t-k//2, t-k//2+k) in padded coords
+        hi = torch.gather(csum, 2, (t + k[:,None])[:,None,:].expand(b, c, -1))
+        lo = torch.gather(csum, 2, t[:,None,:].expand(b, c, -1))
+        return ((hi - lo)/k[:,None,None]).to(signal.dtype)
+
+
+class BatchNormInputs(nn.Module):
+    "NormInputs for batches"
+    def __init__(self, do_norm=False):
+        super().__init__()
+        self.do_norm, self.eps = do_norm, 1e-2
+    def __call__(self, signal):
+        return signal if (not self.do_norm) else signal/(torch.amax(signal,-1)[:,0] + self.eps)[:,None,None]
+
+
+class BatchStereo(nn.Module):
+    "Stereo for batches"
+    def __call__(self, signal):
+        if signal.shape[1] == 1: return signal.expand(-1, 2, -1).contiguous()
+        return signal[:,:2,:]
+
+
+class BatchRandomGain(BatchAug):
+    "RandomGain for batches"
+    def __init__(self, min_gain, max_gain, seed=None):
+        super().__init__(seed=seed)
+        self.min_gain, self.max_gain = min_gain, max_gain
+    def __call__(self, signal):
+        gain = self.min_gain + (self.max_gain - self.min_gain)*self.rand(signal.shape[0], device=signal.device)
+        return signal * gain[:,None,None].to(signal.dtype)
+
+
+class BatchAugs(nn.Module):
+    "runs batch augmentations as a DataLoader collate_fn, on (audio, filename) items that are all the same shape"
+    def __init__(self, *augs):
+        super().__init__()
+        self.augs = nn.Sequential(*augs)
+    def __call__(self, batch):
+        audio = torch.stack([item[0] for item in batch])
+        return self.augs(audio).clamp(-1, 1), [item[1] for item in batch]
+
+# Cell
+def get_rank(
+    num_gpus=1,      # GPUs per node, used if the launcher hasn't said
+    )->tuple:
+    "(global rank, world size) of this process"
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    env = os.environ
+    if 'RANK' in env and 'WORLD_SIZE' in env:
+        return int(env['RANK']), int(env['WORLD_SIZE'])
+    if 'LOCAL_RANK' in env and 'WORLD_SIZE' in env:   # e.g. lightning: global rank = node rank * gpus per node + local rank
+        per_node = int(env.get('LOCAL_WORLD_SIZE', num_gpus))
+        return int(env.get('NODE_RANK', 0))*per_node + int(env['LOCAL_RANK']), int(env['WORLD_SIZE'])
+    return 0, num_gpus   # we're on GPU 0 and the others haven't been started yet
+
+
+def balanced_split(
+    costs:list,      # cost of each item, e.g. duration in seconds
+    n:int,           # number of shards
+    equal_len=False, # make every shard ceil(len(costs)/n) long, topping up short ones with a repeat of their cheapest item
+    )->list:
+    "splits range(len(costs)) into n lists with about the same total cost each. deterministic, so every rank gets the same answer"
+    cap = math.ceil(len(costs)/n) if equal_len else len(costs)
+    shards, heap = [[] for _ in range(n)], [(0, k) for k in range(n)]
+    for i in sorted(range(len(costs)), key=lambda i: (-costs[i], i)):   # biggest first, each to the least-loaded shard that has room
+        load, k = heapq.heappop(heap)
+        shards[k].append(i)
+        if len(shards[k]) < cap: heapq.heappush(heap, (load + costs[i], k))
+    shards = [sorted(sh) for sh in shards]
+    if equal_len:   # e.g. so every DDP rank runs the same number of steps, and none waits forever at a collective
+        for sh in shards:
+            if len(sh) < cap: sh.append(min(sh or range(len(costs)), key=lambda i: (costs[i], i)))
+    return shards
+
+
+def worker_split(
+    items:list,      # e.g. the indices this rank should do
+    )->list:
+    "the part of items this DataLoader worker should do (all of them if not in a worker)"
+    worker = torch.utils.data.get_worker_info()
+    return items if worker is None else items[worker.id::worker.num_workers]
+
+
+class ShardSampler(torch.utils.data.Sampler):
+    "shuffles range(len(data_source)) differently but reproducibly each epoch, for datasets that are already split by rank"
+    def __init__(self, data_source, seed=0, shuffle=True):
+        self.n, self.seed, self.shuffle, self.epoch = len(data_source), seed, shuffle, 0
+
+    def set_epoch(self, epoch): self.epoch = epoch
+
+    def __len__(self): return self.n
+
+    def __iter__(self):
+        if not self.shuffle: return iter(range(self.n))
+        g = torch.Generator().manual_seed(self.seed + 1000003*self.epoch)
+        return iter(torch.randperm(self.n, generator=g).tolist())
+
+# Cell
+def _cached_npz_index(
+    kind:str,          # what it's an index of, for its file name
+    settings:list,     # whatever else it depends on besides the files
+    filenames,         # audio files to index (StringTable)
+    info:dict,         # filename -> [size, mtime, ...]
+    index_dir,         # where to save it; None = don't save
+    measure,           # function of a filename returning (its result, None), or (None, error) if it won't load. runs in parallel
+    build,             # function of the list of each file's result (None if left out or it won't load) returning a dict of arrays
+    known=None,        # optional function of a filename returning its result if that doesn't need measure, else None
+    desc='Indexing',   # progress bar label
+    workers=None,      # number of processes for measure (default: all cpus)
+    bad_files=None,    # optional BadFileList: its files are left out, and files that won't load get added to it
+    )->dict:
+    "the arrays saved for these files (as they are now) & settings, or else measures the files in parallel, builds the arrays & saves them"
+    key = hashlib.md5('\n'.join([str(settings)] + [f'{f}|{info[f][0]}|{info[f][1]}' for f in filenames]).encode()).hexdigest()
+    index_file = None if index_dir is None else f'{os.path.expanduser(index_dir)}/{kind}-{key}.npz'
+    if index_file and os.path.exists(index_file):
+        with np.load(index_file) as z:
+            return {k: z[k] for k in z.files}
+    results, to_measure = [None]*len(filenames), []
+    for k, f in enumerate(filenames):
+        if bad_files is not None and f in bad_files: continue
+        results[k] = None if known is None else known(f)
+        if results[k] is None: to_measure.append(k)
+    if len(to_measure) > 0:
+        with Pool(processes=min(workers or cpu_count(), len(to_measure))) as p:
+            measured = tqdm.tqdm(p.imap(measure, [filenames[k] for k in to_measure], chunksize=4), total=len(to_measure), desc=desc)
+            for k, (r, err) in zip(to_measure, measured):
+                results[k] = r
+                if r is None and bad_files is not None: bad_files.add(filenames[k], err)
+    arrays = build(results)
+    if index_file:
+        makedirs(os.path.dirname(index_file), exist_ok=True)
+        tmp = f'{index_file}.{os.getpid()}.tmp.npz'   # write-then-rename so other processes never see a partial index
+        np.savez(tmp, **arrays)
+        os.replace(tmp, index_file)
+    return arrays
+
+
+def audio_envelope(
+    filename:str,   # audio file to decode
+    sr=48000,       # sample rate to measure at
+    hop=4096,       # samples per envelope frame
+    ):
+    "decodes a file and returns ([2, n_frames] float16 array of peak dB & RMS dB for each hop samples, None), or (None, error) if it won't load"
+    try:
+        audio = load_audio(filename, sr=sr)
+    except Exception as e:
+        return None, repr(e)
+    if audio.shape[-1] == 0: return np.zeros((2, 0), dtype=np.float16), None
+    peak_db, rms_db, _ = chunk_levels(audio, hop, hop)
+    return torch.stack([peak_db.float(), rms_db]).numpy().astype(np.float16), None
+
+
+class EnvelopeIndex():
+    "compact loudness envelope of every file, for drawing crop offsets only from the parts that aren't silent. saved & reused"
+    def __init__(self,
+        filenames:list,    # audio files to index (list or StringTable)
+        info:dict,         # filename -> [size, mtime, ...], e.g. FileIndex.info or FileTable.info
+        sr=48000,          # sample rate the crops are at
+        hop=4096,          # samples per envelope frame
+        index_dir='~/.cache/aeiou', # where to save the index; None = don't save
+        workers=None,      # number of processes for decoding (default: all cpus)
+        bad_files=None,    # optional BadFileList: its files are left out, and files that won't decode get added to it
+        ):
+        self.filenames = filenames if isinstance(filenames, StringTable) else StringTable(filenames)
+        self.sr, self.hop = sr, hop
+        def build(envs):
+            envs = [np.zeros((2, 0), dtype=np.float16) if e is None else e for e in envs]
+            return {'offsets': np.concatenate([[0], np.cumsum([e.shape[1] for e in envs])]).astype(np.int64),  # file k's frames are offsets[k]:offsets[k+1]
+                    'levels': np.concatenate(envs, axis=1)}   # [peak dB, RMS dB] of every frame of every file
+        z = _cached_npz_index('envelope', [sr, hop], self.filenames, info, index_dir, partial(audio_envelope, sr=sr, hop=hop), build,
+                              desc='Measuring envelopes', workers=workers, bad_files=bad_files)
+        self.offsets, self.levels = z['offsets'], z['levels']
+        self.cum = None
+
+    def set_crop(self,
+        sample_size:int,   # crop length in samples
+        thresh=-60,        # a crop needs a frame with at least this peak dB...
+        rms_thresh=None,   # ...and, if given, at least this RMS dB over its frames
+        ):
+        "works out which frames crops can start in. O(total frames), vectorized over all files at once"
+        n, w = self.levels.shape[1], max(1, sample_size//self.hop)
+        file_of = np.repeat(np.arange(len(self.filenames)), np.diff(self.offsets))
+        first, end = self.offsets[:-1][file_of], self.offsets[1:][file_of]   # each frame's file's first frame & end
+        j = np.arange(n)
+        win_end = np.minimum(j + w, end)     # a crop starting in frame j covers about frames j ... win_end-1
+        starts = (j + w <= end) | (j == first)   # crops must fit in the file, unless it's shorter than one crop
+        loud = np.concatenate([[0], np.cumsum(self.levels[0] >= thresh)])
+        ok = starts & (loud[win_end] > loud[j])
+        if rms_thresh is not None:
+            power = np.concatenate([[0], np.cumsum(10**(self.levels[1].astype(np.float64)/10))])
+            ok &= 10*np.log10(np.maximum((power[win_end] - power[j])/(win_end - j), 1e-30)) >= rms_thresh
+        self.cum = np.cumsum(ok)   # number of usable start frames up to & including each frame
+
+    def sample_start(self,
+        filename:str,      # one of the indexed files
+        n_samples:int,     # its length (at sr) in samples
+        sample_size:int,   # crop length, as given to set_crop
+        rng=random,        # random number generator
+        ):
+        "random crop offset (in samples) in filename that isn't silent, in O(log n). None if there isn't one"
+        try:
+            k = self.filenames.index(filename)
+        except ValueError as e:
+            return None
+        if self.offsets[k+1] == self.offsets[k]: return None
+        lo = self.cum[self.offsets[k]-1] if self.offsets[k] > 0 else 0
+        hi = self.cum[self.offsets[k+1]-1]
+        if hi == lo: return None   # silent all the way through
+        frame = np.searchsorted(self.cum, rng.randrange(lo, hi), side='right') - self.offsets[k]
+        return max(0, min(frame*self.hop + rng.randrange(self.hop), n_samples - sample_size))
+
+# Cell
+class AudioCache():
+    "LRU cache of decoded audio (stored with to_pcm) that keeps under a byte budget, optionally spilling what it evicts to disk"
+    def __init__(self,
+        max_bytes:int,      # most bytes of audio to keep in RAM, in this process
+        dtype='float16',    # storage dtype, see to_pcm
+        spill_dir=None,     # if given, evicted entries get saved here and read back from here instead of decoded again
+        spill_bytes=None,   # if given, the least recently used files in spill_dir get deleted to keep it under this many bytes
+        report_every=0,     # print stats every this many lookups; 0 = never
+        ):
+        self.max_bytes, self.dtype, self.spill_dir, self.report_every = max_bytes, dtype, spill_dir, report_every
+        self.spill_bytes = spill_bytes
+        self.entries, self.nbytes = OrderedDict(), 0   # key -> stored array, least recently used first
+        self.stats = {'hits':0, 'spill_hits':0, 'misses':0, 'evictions':0, 'spills':0, 'spill_deletes':0}
+        if spill_dir is not None: makedirs(os.path.expanduser(spill_dir), exist_ok=True)
+
+    def spill_file(self, key):
+        return f'{os.path.expanduser(self.spill_dir)}/{hashlib.md5(f"{key}|{self.dtype}".encode()).hexdigest()}.npy'
+
+    def get(self,
+        key:str,            # e.g. filename plus whatever would change its decoded audio
+        load_fn=None,       # called with no arguments on a miss, to get the float audio to cache
+        ):
+        "cached array for key (from to_pcm), now most recently used. on a miss, caches & returns to_pcm(load_fn()), or None if there's no load_fn"
+        pcm = self.entries.pop(key, None)
+        if pcm is not None:
+            self.nbytes -= pcm.nbytes
+            self.stats['hits'] += 1
+        elif self.spill_dir is not None and os.path.exists(self.spill_file(key)):
+            try:
+                os.utime(self.spill_file(key))   # its mtime says when it was last used, for trim_spill
+                pcm = np.load(self.spill_file(key))
+                self.stats['spill_hits'] += 1
+            except Exception as e:   # e.g. half-written by a process that got killed
+                pcm = None
+        if pcm is None:
+            self.stats['misses'] += 1
+            if load_fn is None: return None
+            pcm = to_pcm(load_fn(), self.dtype)
+        self.put(key, pcm)
+        if self.report_every > 0 and sum(self.stats[k] for k in ['hits','spill_hits','misses']) % self.report_every == 0:
+            print(self.summary(), flush=True)
+        return pcm
+
+    def put(self, key, pcm):
+        "adds an array (from to_pcm) as most recently used, evicting least recently used ones until under max_bytes"
+        if key in self.entries: self.nbytes -= self.entries.pop(key).nbytes
+        self.entries[key], self.nbytes = pcm, self.nbytes + pcm.nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 0:
+            old_key, old = self.entries.popitem(last=False)
+            self.nbytes -= old.nbytes
+            self.stats['evictions'] += 1
+            if self.spill_dir is not None: self.spill(old_key, old)
+
+    def spill(self, key, pcm):
+        "saves an evicted array to spill_dir, unless it's already there"
+        filename = self.spill_file(key)
+        if os.path.exists(filename): return
+        tmp = f'{filename}.{os.getpid()}.tmp.npy'
+        try:
+            np.save(tmp, pcm)
+            os.replace(tmp, filename)
+            self.stats['spills'] += 1
+        except OSError as e:   # e.g. disk full: it just gets decoded again next time
+            if os.path.exists(tmp): os.remove(tmp)
+        if self.spill_bytes is not None: self.trim_spill()
+
+    def trim_spill(self):
+        "deletes the least recently used files in spill_dir (whichever process spilled them) until they add up to at most spill_bytes"
+        files = []
+        for e in os.scandir(os.path.expanduser(self.spill_dir)):
+            if not e.name.endswith('.npy') or e.name.endswith('.tmp.npy'): continue   # leave files still being written alone
+            try:
+                st = e.stat()
+            except OSError as err:   # deleted by another process meanwhile
+                continue
+            files.append((st.st_mtime, st.st_size, e.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.spill_bytes: break
+            try:
+                os.remove(path)
+                self.stats['spill_deletes'] += 1
+            except OSError as err:   # another process got there first
+                pass
+            total -= size
+
+    def summary(self):
+        s = self.stats
+        lookups = max(1, s['hits'] + s['spill_hits'] + s['misses'])
+        return (f"audio cache (pid {os.getpid()}): {s['hits']} hits, {s['spill_hits']} from disk, {s['misses']} misses ({100*s['misses']/lookups:.1f}%), "
+                f"{s['evictions']} evictions, {s['spills']} spilled, {len(self.entries)} files / {self.nbytes/2**20:.0f} MB in RAM")
+
 # Cell
 # modified from https://github.com/drscotthawley/audio-diffusion/blob/main/dataset/dataset.py
 class MultiStemDataset(torch.utils.data.Dataset):
   def __init__(self, paths, global_args):
     super().__init__()
-    self.filenames = []
     self.augs = torch.nn.Sequential(
       PadCrop(global_args.sample_size, randomize=global_args.random_crop),
       #RandomGain(0.7, 1.0),
@@ -119,83 +510,434 @@ class MultiStemDataset(torch.utils.data.Dataset):
       PhaseFlipper(),
       #NormInputs(do_norm=global_args.norm_inputs),
     )
+    if getattr(global_args, 'batch_augs', False): # only crop here; the rest gets done on whole batches, e.g. by BatchAugs as the collate_fn
+      self.augs = torch.nn.Sequential(self.augs[0])
 
     self.encoding = torch.nn.Sequential(
       Stereo()
     )
 
-    for path in paths:   # get a list of relevant filenames
-      for ext in ['wav','flac','ogg','aiff','aif','mp3']:
-        self.filenames += glob(f'{path}/**/*.{ext}', recursive=True)
+    file_index = FileIndex(paths)   # get a list of relevant filenames, and their sizes, sample rates, etc.
 
     self.sr = global_args.sample_rate
+    self.sample_size, self.random_crop = global_args.sample_size, global_args.random_crop
+    self.partial_decode = getattr(global_args, 'partial_decode', True) # uncached: only decode the part of the file we'll crop
     if hasattr(global_args,'load_frac'):
       self.load_frac = global_args.load_frac
     else:
       self.load_frac = 1.0
-    self.n_files = int(len(self.filenames)*self.load_frac)
-    self.filenames = self.filenames[0:self.n_files]
+    self.n_files = int(len(file_index.filenames)*self.load_frac)
+    # compact copy for DataLoader workers, see 'Compact tables' in core
+    self.file_index = FileTable(file_index.filenames[0:self.n_files], file_index.info)
+    self.filenames = self.file_index.filenames
 
     self.num_gpus = global_args.num_gpus
+    self.rank, self.world_size = get_rank(self.num_gpus)
 
     self.cache_training_data = global_args.cache_training_data
-
-    if self.cache_training_data: self.preload_files()
+    self.cache_dir = getattr(global_args, 'cache_dir', None)   # if set, cache goes in one memory-mapped file shared by all workers & ranks
+    self.cache_dtype = getattr(global_args, 'cache_dtype', 'int16') # storage type of cached audio (see to_pcm)
+    if self.cache_dtype == 'int24' and self.cache_dir is not None:
+      raise ValueError("cache_dtype='int24' only works for the in-RAM cache (no cache_dir)")
+    self.resample_batch = getattr(global_args, 'resample_batch', 1) # when caching, load & resample this many same-rate files per call
+    self.crops_per_load = getattr(global_args, 'crops_per_load', 1)   # uncached: each decoded file serves this many items (crops)
+    self.load_cache_size = getattr(global_args, 'load_cache_size', 16) # most decoded files to keep around, per worker
+    self.load_cache = OrderedDict()   # index in self.filenames -> [audio, times used], least recently used first
+    self.audio_cache = None   # uncached: if cache_bytes is set, decoded files are kept in an AudioCache with that budget (per worker)
+    if getattr(global_args, 'cache_bytes', None) is not None and not self.cache_training_data:
+      self.audio_cache = AudioCache(int(global_args.cache_bytes), dtype=self.cache_dtype,
+        spill_dir=getattr(global_args, 'cache_spill_dir', None), spill_bytes=getattr(global_args, 'cache_spill_bytes', None),
+        report_every=getattr(global_args, 'cache_report_every', 0))
+
+    self.inds = np.arange(len(self.filenames))   # which of self.filenames this dataset covers
+    if getattr(global_args, 'shard_by_rank', False) or (self.cache_training_data and self.cache_dir is None):
+      costs = [estimate_duration(rec) for rec in self.file_index.recs.tolist()]
+      self.inds = np.array(balanced_split(costs, self.world_size, equal_len=True)[self.rank], dtype=np.int64)   # may repeat one file
+
+    self.bad_files = BadFileList(getattr(global_args, 'bad_file_list', '~/.cache/aeiou/bad_files.tsv')) # files that won't load get skipped
+    if getattr(global_args, 'validate_files', False):
+      self.validate_files()
+
+    self.envelope = None   # if set, random crops only start where there's some sound
+    if getattr(global_args, 'silence_aware_crop', False) and self.random_crop:
+      self.envelope = EnvelopeIndex(self.filenames[np.unique(self.inds)], self.file_index.info, sr=self.sr,
+        hop=getattr(global_args, 'envelope_hop', 4096), index_dir=getattr(global_args, 'envelope_dir', '~/.cache/aeiou'), bad_files=self.bad_files)
+      self.envelope.set_crop(self.sample_size, thresh=getattr(global_args, 'crop_thresh', -60), rms_thresh=getattr(global_args, 'crop_rms_thresh', None))
+
+    if self.cache_training_data:
+      if self.cache_dir is not None:
+        self.mmap_files()
+      else:
+        self.preload_files()
 
 
   def load_file(self, filename):
     audio, sr = torchaudio.load(filename)
     if sr != self.sr:
-      resample_tf = T.Resample(sr, self.sr)
-      audio = resample_tf(audio)
+      audio = get_resampler(sr, self.sr, dtype=audio.dtype)(audio)
     return audio
 
+  def load_crop(self, filename):
+    "decodes just a sample_size window of the file, picking the crop offset from the file's length in the index"
+    size, mtime, in_sr, channels, frames = self.file_index.info[filename]
+    if frames <= 0 or in_sr <= 0: return self.load_file(filename) # length unknown (e.g. some mp3s): decode it all
+    n_out = math.ceil(frames*self.sr/in_sr)
+    start = 0 if (not self.random_crop) else self.crop_start(filename, n_out)
+    return load_audio_window(filename, start, self.sample_size, sr=self.sr, in_sr=in_sr)
+
+  def crop_start(self, filename, n_samples):
+    "random crop offset: from the EnvelopeIndex if there is one, otherwise uniform"
+    start = None if self.envelope is None else self.envelope.sample_start(filename, n_samples, self.sample_size)
+    if start is None: start = torch.randint(0, max(0, n_samples - self.sample_size) + 1, []).item()
+    return start
+
+  def load_shared(self, i, filename):
+    "decoded file i from this worker's LRU cache (decoding it if it's not there), which keeps it for crops_per_load uses"
+    entry = self.load_cache.pop(i, None)
+    if entry is None: entry = [self.load_file(filename), 0]
+    entry[1] += 1
+    if entry[1] < self.crops_per_load:   # put it back as most recently used
+      self.load_cache[i] = entry
+      while len(self.load_cache) > self.load_cache_size: self.load_cache.popitem(last=False)
+    return entry[0]
+
+  def validate_files(self): # try decoding this dataset's files in parallel, so bad ones are known before training
+    todo = [self.filenames[i] for i in np.unique(self.inds) if self.filenames[i] not in self.bad_files]
+    with Pool(processes=cpu_count()) as p:
+      errors = list(tqdm.tqdm(p.imap(check_audio_file, todo, chunksize=16), total=len(todo), desc='Checking files'))
+    for f, err in zip(todo, errors):
+      if err is not None: self.bad_files.add(f, err)
+    print(f"{len(self.bad_files)} bad files known, {self.bad_files.counts['failed']} found just now")
+
   def load_file_ind(self, file_list,i): # used when caching training data
     return self.load_file(file_list[i]).cpu()
 
-  def get_data_range(self): # for parallel runs, only grab part of the data
-    start, stop = 0, len(self.filenames)
+  def load_files_inds(self, file_list, inds): # batched version of load_file_or_error
     try:
-      local_rank = int(os.environ["LOCAL_RANK"])
-      world_size = int(os.environ["WORLD_SIZE"])
-      interval = stop//world_size
-      start, stop = local_rank*interval, (local_rank+1)*interval
-      #print("local_rank, world_size, start, stop =",local_rank, world_size, start, stop)
-      return start, stop
-      #rank = os.environ["RANK"]
-    except KeyError as e: # we're on GPU 0 and the others haven't been initialized yet
-      start, stop = 0, len(self.filenames)//self.num_gpus
-      return start, stop
-
-  def preload_files(self):
-      print(f"Caching {self.n_files} input audio files:")
-      wrapper = partial(self.load_file_ind, self.filenames)
-      start, stop = self.get_data_range()
+      return [(a.cpu(), None) for a in load_audio_batch([file_list[i] for i in inds], sr=self.sr)]
+    except Exception as e:   # one bad file spoils the batch, so load them one at a time
+      return [self.load_file_or_error(file_list, i) for i in inds]
+
+  def batch_by_sr(self, inds): # groups of up to resample_batch indices whose files share a sample rate
+    by_sr = {}
+    for i in inds: by_sr.setdefault(int(self.file_index.recs['sample_rate'][i]), []).append(i)
+    return [g[j:j+self.resample_batch] for g in by_sr.values() for j in range(0, len(g), self.resample_batch)]
+
+  def preload_files(self): # only this rank's files: self.audio_files[idx] goes with self.filenames[self.inds[idx]], stored with to_pcm
+      todo = list(dict.fromkeys(self.inds.tolist()))   # a file repeated to even out the ranks only gets loaded once
+      print(f"Caching {len(todo)} of {self.n_files} input audio files as {self.cache_dtype} (rank {self.rank} of {self.world_size}):")
+      wrapper = partial(self.load_file_or_error, self.filenames)
+      pcm = {}
       with Pool(processes=cpu_count()) as p:   # //8 to avoid FS bottleneck and/or too many processes (b/c * num_gpus)
-        self.audio_files = list(tqdm.tqdm(p.imap(wrapper, range(start,stop)), total=stop-start))
+        if self.resample_batch > 1:
+          groups = self.batch_by_sr(todo)
+          batch_wrapper = partial(self.load_files_inds, self.filenames)
+          loaded = ((i, r) for inds, results in zip(groups, tqdm.tqdm(p.imap(batch_wrapper, groups), total=len(groups))) for i, r in zip(inds, results))
+        else:
+          loaded = zip(todo, tqdm.tqdm(p.imap(wrapper, todo), total=len(todo)))
+        for i, (audio, err) in loaded:
+          if err is not None: self.bad_files.add(self.filenames[i], err)
+          pcm[i] = to_pcm(audio, self.cache_dtype)
+      self.audio_files = [pcm[i] for i in self.inds.tolist()]
+
+  def load_file_or_error(self, file_list, i): # used when caching: (audio, None), or (empty placeholder, error) if it won't load
+    try:
+      return self.load_file(file_list[i]).cpu(), None
+    except Exception as e:
+      return torch.zeros(1,0), repr(e) # placeholder so cache indices still line up with filenames
+
+  def mmap_files(self):
+      "decodes/resamples everything once into a single shard in cache_dir that every worker & rank maps read-only"
+      recs = self.file_index.recs   # files' sizes & mtimes are in the fingerprint, so changed files get the cache rebuilt
+      fingerprint = hashlib.md5('\n'.join([str(self.sr), self.cache_dtype] + [f'{f}|{size}|{mtime!r}'
+        for f, size, mtime in zip(self.filenames, recs['size'].tolist(), recs['mtime'].tolist())]).encode()).hexdigest()
+      done_file, lock_file = f'{self.cache_dir}/cache.done', f'{self.cache_dir}/cache.lock'
+      def is_done():
+        if not os.path.exists(done_file): return False
+        with open(done_file) as f: return f.read() == fingerprint
+      if not is_done():
+        makedirs(self.cache_dir, exist_ok=True)
+        with open(lock_file, 'a+') as lock:   # whoever gets the lock builds the cache; everyone else waits for it
+          try:   # the OS lets go of the lock if its holder dies, so there's no stale lock to clean up
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+          except BlockingIOError as e:
+            print(f"Waiting for another process to finish caching to {self.cache_dir}", flush=True)
+            fcntl.flock(lock, fcntl.LOCK_EX)
+          if not is_done():   # it wasn't built while we waited (or its builder died)
+            lock.truncate(0)
+            lock.write(f'{socket.gethostname()} {os.getpid()}\n')   # just so people can see who's building it
+            lock.flush()
+            self.build_mmap_cache(fingerprint, lock_file)
+      self.audio_files = ShardReader(self.cache_dir, prefix='cache')
+
+  def build_mmap_cache(self, fingerprint, lock_file): # called by mmap_files, holding the lock
+      print(f"Caching {self.n_files} input audio files to {self.cache_dir}:")
+      for f in glob(f'{self.cache_dir}/cache*'):
+        if f != lock_file: os.remove(f)
+      writer = ShardWriter(self.cache_dir, prefix='cache', dtype=self.cache_dtype, max_bytes=2**62, meta={'sr':self.sr})
+      wrapper = partial(self.load_file_or_error, self.filenames)
+      with Pool(processes=cpu_count()) as p:
+        for i, (audio, err) in enumerate(tqdm.tqdm(p.imap(wrapper, range(len(self.filenames))), total=len(self.filenames))):
+          if err is not None: self.bad_files.add(self.filenames[i], err)
+          writer.add(audio, self.filenames[i])
+      writer.close()
+      with open(f'{self.cache_dir}/cache.done', 'w') as f: f.write(fingerprint)
 
   def __len__(self):
-    return len(self.filenames)
+    return len(self.inds)*self.crops_per_load
+
+  def load_item(self, local, i): # audio for an item of file i (= self.inds[local]), before augmentation. raises if it won't load
+    audio_filename, pcm = self.filenames[i], None
+    if self.cache_training_data:  # the preloaded cache only holds this rank's files; the mmap cache has them all
+      pcm = self.audio_files[local] if self.cache_dir is None else self.audio_files.raw(i)
+    elif self.audio_cache is not None:   # decoded on a miss
+      size, mtime = self.file_index.info[audio_filename][:2]
+      pcm = self.audio_cache.get(f'{audio_filename}|{size}|{mtime}|{self.sr}', lambda: self.load_file(audio_filename))
+    elif self.crops_per_load > 1:
+      audio = self.load_shared(i, audio_filename)
+    elif self.partial_decode:
+      audio = self.load_crop(audio_filename)  # PadCrop then just pads if needed
+    else:
+      audio = self.load_file(audio_filename)
+    if pcm is not None:
+      n = pcm.shape[1]   # (int24 has an extra last axis)
+      if n == 0: raise ValueError(f"{audio_filename} is empty, or failed to load while caching")
+      start = self.crop_start(audio_filename, n) if self.random_crop else 0
+      audio = from_pcm(pcm[:, start:start+self.sample_size])   # only dequantize the crop; PadCrop then just pads
+    if self.envelope is not None and audio.shape[-1] > self.sample_size:   # crop here instead of in PadCrop
+      start = self.crop_start(audio_filename, audio.shape[-1])
+      audio = audio[:, start:start+self.sample_size]
+    return audio
+
+  def item_source(self, idx): # (audio file, name to give the example, function that loads its audio before augmentation) for item idx
+    local = idx // self.crops_per_load   # items local*crops_per_load ... are all crops of the same file
+    i = self.inds[local]   # index into self.filenames
+    return self.filenames[i], self.filenames[i], partial(self.load_item, local, i)
 
   def __getitem__(self, idx):
-    audio_filename = self.filenames[idx]
-    try:
-      if self.cache_training_data:
-        audio = self.audio_files[idx] # .copy()
+    for tries in range(100):   # if a file won't load, use a random other item instead
+      audio_filename, name, load = self.item_source(idx)
+      if audio_filename in self.bad_files:
+        self.bad_files.counts['skipped'] += 1
       else:
-        audio = self.load_file(audio_filename)
+        try:
+          with timed('load') as t:
+            audio = load()
+            t.count(audio.shape[-1])
+          break
+        except Exception as e:
+          self.bad_files.add(audio_filename, repr(e))
+      idx = random.randrange(len(self))
+    else:
+      raise RuntimeError(f"Couldn't load 100 files in a row, e.g. {audio_filename}. Bad files are listed in {self.bad_files.path}")
+    return self.make_example(audio, name)
 
-      #Run augmentations on this sample (including random crop)
+  def make_example(self, audio, audio_filename):
+    "runs augmentations (including random crop) and encoding on loaded audio"
+    with timed('augs', self.sample_size):
       if self.augs is not None:
         audio = self.augs(audio)
-
       audio = audio.clamp(-1, 1)
 
-      #Encode the file to assist in prediction
-      if self.encoding is not None:
+    #Encode the file to assist in prediction
+    if self.encoding is not None:
+      with timed('encoding', self.sample_size):
         audio = self.encoding(audio)
 
-      return (audio, audio_filename)
+    return (audio, audio_filename)
+
+# Cell
+class FileGroupBatchSampler(torch.utils.data.Sampler):
+    "batches of MultiStemDataset indices in which all crops of a file go to the same DataLoader worker, close together"
+    def __init__(self,
+        dataset,              # a MultiStemDataset
+        batch_size:int,       # examples per batch
+        files_per_batch=None, # number of files whose crops get mixed together (default: batch_size)
+        num_workers=0,        # same as the DataLoader's num_workers
+        seed=0,               # random seed; shuffles are different but reproducible each epoch (see set_epoch)
+        drop_last=False,      # drop each worker's last, incomplete batch
+        ):
+        self.n_files, self.k = len(dataset.inds), dataset.crops_per_load
+        self.batch_size, self.files_per_batch = batch_size, files_per_batch or batch_size
+        self.num_workers, self.seed, self.drop_last, self.epoch = max(1, num_workers), seed, drop_last, 0
+
+    def set_epoch(self, epoch): self.epoch = epoch
+
+    def batches(self):
+        g = torch.Generator().manual_seed(self.seed + 1000003*self.epoch)
+        files = torch.randperm(self.n_files, generator=g).tolist()
+        streams = [[] for _ in range(self.num_workers)]   # DataLoader gives batch j to worker j % num_workers
+        for n, j in enumerate(range(0, self.n_files, self.files_per_batch)):
+            crops = torch.tensor([f*self.k + c for f in files[j:j+self.files_per_batch] for c in range(self.k)])
+            streams[n % self.num_workers] += crops[torch.randperm(len(crops), generator=g)].tolist()
+        queues = [[s[j:j+self.batch_size] for j in range(0, len(s), self.batch_size)] for s in streams]
+        if self.drop_last: queues = [[b for b in q if len(b) == self.batch_size] for q in queues]
+        return [q[r] for r in range(max(len(q) for q in queues)) for q in queues if r < len(q)]
+
+    def __len__(self): return len(self.batches())
+
+    def __iter__(self): return iter(self.batches())
+
+# Cell
+class StreamingStemDataset(MultiStemDataset, torch.utils.data.IterableDataset):
+  "streams crops from files in shuffled order with a bounded shuffle buffer, instead of loading items by index"
+  def __init__(self, paths, global_args):
+    global_args = copy.copy(global_args)
+    global_args.cache_training_data, global_args.shard_by_rank = False, True  # DDP samplers don't split iterable datasets, so we do
+    global_args.silence_aware_crop = False
+    super().__init__(paths, global_args)
+    self.crops_per_file = getattr(global_args, 'crops_per_file', 8)    # crops per decoded file
+    self.shuffle_buffer = getattr(global_args, 'shuffle_buffer', 1024) # examples to shuffle among, per worker
+    self.prefetch = getattr(global_args, 'stream_prefetch', 4)         # files to decode ahead, in threads
+    self.decode_window = getattr(global_args, 'decode_window', 4*self.crops_per_file*self.sample_size) # most samples to decode per file
+    self.seed, self.epoch = getattr(global_args, 'seed', 0), 0
+
+  def set_epoch(self, epoch):
+    self.epoch = epoch
+
+  def __len__(self):
+    return len(self.inds)*self.crops_per_file
+
+  def load_stream_file(self, filename):
+    "decodes a file, or a random decode_window of it if it's longer than that. None if it won't load"
+    if filename in self.bad_files:
+      self.bad_files.counts['skipped'] += 1
+      return None
+    try:
+      size, mtime, in_sr, channels, frames = self.file_index.info[filename]
+      n_out = math.ceil(frames*self.sr/in_sr) if (frames > 0 and in_sr > 0) else 0
+      if self.partial_decode and n_out > self.decode_window:
+        start = random.randrange(n_out - self.decode_window + 1)
+        return load_audio_window(filename, start, self.decode_window, sr=self.sr, in_sr=in_sr)
+      return self.load_file(filename)
+    except Exception as e:
+      self.bad_files.add(filename, repr(e))
+      return None
+
+  def __iter__(self):
+    inds = self.inds.copy()
+    np.random.default_rng(self.seed + 1000003*self.epoch).shuffle(inds)  # same order on every worker, so they can split it
+    inds = worker_split(inds)
+    worker = torch.utils.data.get_worker_info()
+    rng = random.Random(self.seed + 1000003*self.epoch + 7919*(1 + self.rank) + (0 if worker is None else worker.id + 1))
+    buffer = []
+    with ThreadPoolExecutor(max(1, self.prefetch)) as pool:
+      loads = deque(pool.submit(self.load_stream_file, self.filenames[i]) for i in inds[:self.prefetch+1])
+      for k, i in enumerate(inds):
+        audio_filename = self.filenames[i]
+        audio = loads.popleft().result()
+        if k + len(loads) + 1 < len(inds): loads.append(pool.submit(self.load_stream_file, self.filenames[inds[k + len(loads) + 1]]))
+        if audio is None or audio.shape[-1] == 0: continue
+        for c in range(self.crops_per_file):
+          buffer.append(self.make_example(audio, audio_filename))
+        while len(buffer) >= self.shuffle_buffer:   # yield a random one
+          j = rng.randrange(len(buffer))
+          buffer[j], buffer[-1] = buffer[-1], buffer[j]
+          yield buffer.pop()
+    rng.shuffle(buffer)
+    yield from buffer
+
+# Cell
+def count_chunks(
+    n_samples:int,   # length of the audio, in samples
+    chunk_size:int,  # how big each audio chunk is, in samples
+    overlap=0.5,     # fraction of each chunk to overlap between hops
+    )->int:
+    "number of chunks blow_chunks makes from n_samples of audio"
+    return math.ceil(n_samples/int(overlap*chunk_size))
+
+
+def chunk_silence(
+    filename:str,     # audio file to decode
+    chunk_size:int,   # how big each audio chunk is, in samples
+    sr=48000,         # sample rate the chunks are at
+    overlap=0.5,      # fraction of each chunk to overlap between hops
+    strip=False,      # find which chunks are silent (otherwise none are)
+    thresh=-70,       # threshold in dB for determining what counts as silence
+    rms_thresh=None,  # if stripping: chunks with RMS in dB below this value count as silence too
+    silent_frac=None, # if stripping: chunks with at least this fraction of silent (below thresh) frames count as silence too
+    ):
+    "decodes a file and returns (silent flag of each of its chunk positions, None), or (None, error) if it won't load"
+    try:
+        audio = load_audio(filename, sr=sr)
     except Exception as e:
-     # print(f'Couldn\'t load file {audio_filename}: {e}')
-      return self[random.randrange(len(self))]
+        return None, repr(e)
+    n_chunks = count_chunks(audio.shape[-1], chunk_size, overlap=overlap)
+    if not strip or n_chunks == 0: return np.zeros(n_chunks, dtype=bool), None
+    silent = silence_mask(audio, chunk_size, int(overlap*chunk_size), thresh=thresh, rms_thresh=rms_thresh, silent_frac=silent_frac)
+    return silent.numpy(), None
+
+
+class ChunkIndex():
+    "array-backed index of every chunk position in some files, as blow_chunks would make them. saved & reused for the same files & settings"
+    def __init__(self,
+        filenames:list,    # audio files to index (list or StringTable)
+        info:dict,         # filename -> [size, mtime, sample_rate, channels, frames], e.g. FileIndex.info or FileTable.info
+        chunk_size:int,    # how big each audio chunk is, in samples
+        sr=48000,          # sample rate the chunks are at
+        overlap=0.5,       # fraction of each chunk to overlap between hops
+        strip=False,       # flag silent chunks (needs every file decoded once)
+        thresh=-70,        # threshold in dB for determining what counts as silence
+        rms_thresh=None,   # if stripping: chunks with RMS in dB below this value count as silence too
+        silent_frac=None,  # if stripping: chunks with at least this fraction of silent frames count as silence too
+        index_dir='~/.cache/aeiou', # where to save the index; None = don't save
+        workers=None,      # number of processes for decoding (default: all cpus)
+        bad_files=None,    # optional BadFileList: its files are left out, and files that won't decode get added to it
+        ):
+        self.filenames = filenames if isinstance(filenames, StringTable) else StringTable(filenames)
+        self.chunk_size, self.hop = chunk_size, int(overlap*chunk_size)
+        def known(f):   # no need to decode if the length is known & nothing's being stripped
+            size, mtime, in_sr, channels, frames = info[f]
+            if strip or frames <= 0 or in_sr <= 0: return None
+            return np.zeros(count_chunks(math.ceil(frames*sr/in_sr), chunk_size, overlap=overlap), dtype=bool)
+        def build(silent):
+            silent = [np.zeros(0, dtype=bool) if s is None else s for s in silent]
+            lengths = np.array([len(s) for s in silent], dtype=np.int64)
+            file_id = np.repeat(np.arange(len(silent), dtype=np.int32), lengths)
+            first = np.repeat(np.cumsum(lengths) - lengths, lengths)   # index of each chunk's file's first chunk
+            return {'file_id': file_id, 'start': (np.arange(len(file_id), dtype=np.int64) - first) * self.hop,
+                    'silent': np.concatenate(silent) if len(silent) > 0 else np.zeros(0, dtype=bool)}
+        measure = partial(chunk_silence, chunk_size=chunk_size, sr=sr, overlap=overlap, strip=strip, thresh=thresh, rms_thresh=rms_thresh, silent_frac=silent_frac)
+        z = _cached_npz_index('chunks', [sr, chunk_size, overlap, strip, thresh, rms_thresh, silent_frac], self.filenames, info, index_dir,
+                              measure, build, known=known, desc='Indexing chunks', workers=workers, bad_files=bad_files)
+        self.file_id, self.start, self.silent = z['file_id'], z['start'], z['silent']
+
+    def __len__(self):
+        return len(self.file_id)
+
+    def chunk_name(self, k):
+        "what chunkadelic would call chunk k's file"
+        base, ext = os.path.splitext(self.filenames[self.file_id[k]])
+        return f'{base}--{self.start[k]//self.hop}{ext}'
+
+
+class ChunkDataset(MultiStemDataset):
+  "the (non-silent) chunks chunkadelic would make, decoded on the fly from the original files via a ChunkIndex"
+  def __init__(self, paths, global_args):
+    global_args = copy.copy(global_args)
+    global_args.cache_training_data, global_args.crops_per_load, global_args.silence_aware_crop = False, 1, False
+    super().__init__(paths, global_args)
+    self.chunk_size = getattr(global_args, 'chunk_size', self.sample_size)
+    self.index = ChunkIndex(self.filenames[np.unique(self.inds)], self.file_index.info, self.chunk_size, sr=self.sr,
+      overlap=getattr(global_args, 'overlap', 0.5), strip=getattr(global_args, 'strip', False), thresh=getattr(global_args, 'thresh', -70),
+      rms_thresh=getattr(global_args, 'rms_thresh', None), silent_frac=getattr(global_args, 'silent_frac', None),
+      index_dir=getattr(global_args, 'chunk_index_dir', '~/.cache/aeiou'), bad_files=self.bad_files)
+    self.items = np.flatnonzero(~self.index.silent)   # the chunks blow_chunks would have saved
+    print(f"{len(self.items)} chunks ({len(self.index) - len(self.items)} silent ones left out) from {len(self.index.filenames)} files")
+
+  def __len__(self):
+    return len(self.items)
+
+  def load_chunk(self, filename, start):
+    "decodes one chunk, zero-padded at the end of the file like blow_chunks does"
+    in_sr = self.file_index.info[filename][2]
+    if in_sr <= 0:   # length unknown when indexed (e.g. some mp3s): decode it all
+      audio = self.load_file(filename)[:, start:start+self.chunk_size]
+    else:
+      audio = load_audio_window(filename, start, self.chunk_size, sr=self.sr, in_sr=in_sr)
+    return F.pad(audio, (0, self.chunk_size - audio.shape[-1]))
+
+  def item_source(self, idx): # what MultiStemDataset.__getitem__ loads (retrying others if a file won't load): chunk k = self.items[idx]
+    k = self.items[idx]
+    audio_filename = self.index.filenames[self.index.file_id[k]]
+    return audio_filename, self.index.chunk_name(k), partial(self.load_chunk, audio_filename, int(self.index.start[k]))
\ No newline at end of file
@@ -1,6 +1,7 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/spectro_fu.ipynb (unless otherwise specified).
 
-__all__ = ['stf_up', 'process_one_file', 'main']
+__all__ = ['stf_up', 'get_new_filename', 'mel_features', 'get_writer', 'read_mel', 'mel_up', 'process_one_file',
+           'process_batch', 'process_task', 'main']
 
 # Cell
 import argparse
@@ -13,76 +14,207 @@ from functools import partial
 from tqdm.contrib.concurrent import process_map
 import torch
 import torchaudio
-from .core import is_silence, load_audio, makedir
-from .viz import audio_spectrogram_image
+from .core import is_silence, load_audio, makedir, ShardWriter, ShardReader, FileIndex, schedule_tasks, estimate_duration
+from .core import timed, enable_timings, save_timings, load_timings, print_timings
+from .viz import audio_spectrogram_image, audio_spectrogram_images, get_mel_transform, power_to_db
 
 # Cell
 
 def stf_up(
     audio:torch.tensor,  # long audio file to be chunked
-    new_filename:str    # stem of new filename(s) to be output as spectrogram images
+    new_filename:str,   # stem of new filename(s) to be output as spectrogram images
+    fast=False,         # skip matplotlib and use audio_spectrogram_images instead
+    sr=48000,           # audio sample rate (only used by the fast path)
     ):
     "coverts audio to stft image and saves it"
-    im = audio_spectrogram_image(audio, justimage=True)  # should already be a PIL image
+    with timed('render', audio.shape[-1]):
+        if fast:
+            im = audio_spectrogram_images([audio], sample_rate=sr)[0]
+        else:
+            im = audio_spectrogram_image(audio, justimage=True)  # should already be a PIL image
     print(f"saving new file = {new_filename}")
-    im.save(new_filename)
+    with timed('save'):
+        im.save(new_filename)
     return
 
 
-def process_one_file(
-    filenames:list,      # list of filenames from which we'll pick one
+def get_new_filename(
+    filename:str,        # input filename
     args,                # output of argparse
-    file_ind             # index from filenames list to read from
+    ext=".png",          # file extension for the output
+    make_dirs=True,      # make the folder(s) the output file goes in
     ):
-    "this turns one audio file into a spectrogram.  left channel only for now"
-    filename = filenames[file_ind]  # this is actually input_path+/+filename
+    "output filename for an input file, making any folders it needs. None if something's wrong"
     output_path, input_paths = args.output_path, args.input_paths
-    new_filename = None
-
     for ipath in input_paths: # set up the output filename & any folders it needs
         if ipath in filename: # this just avoids repeats/ weirdness.
             last_ipath = ipath.split('/')[-1]           # get the last part of ipath
             clean_filename = filename.replace(ipath,'') # remove all of ipath from the front of filename
             new_filename = f"{output_path}/{last_ipath}/{clean_filename}".replace('//','/')
-            new_filename = str(Path(new_filename).with_suffix(".png"))  # give it file extension for image
-            makedir(os.path.dirname(new_filename))      # we might need to make a directory for the output file
-            break
+            new_filename += ext   # keep the audio extension too, so that x.wav and x.flac don't both become x.png
+            if make_dirs: makedir(os.path.dirname(new_filename))  # we might need to make a directory for the output file
+            return new_filename
+    print(f"ERROR: Something went wrong with name of input file {filename}. Skipping.",flush=True)
+    return None
+
+
+def mel_features(
+    audio:torch.tensor,  # [channels, samples] audio
+    sr=48000,            # audio sample rate
+    n_fft=1024,          # FFT size
+    hop_length=None,     # hop between frames; None = n_fft//4
+    n_mels=128,          # number of mel bins
+    scale='db',          # 'db' for log-mel, 'power' for plain mel power
+    ):
+    "[channels, n_mels, frames] mel spectrogram of every channel"
+    melspec = get_mel_transform(sample_rate=sr, n_fft=n_fft, hop_length=hop_length or n_fft//4, n_mels=n_mels)(audio.float())
+    return power_to_db(melspec) if scale == 'db' else melspec
+
+
+_writer = None  # one ShardWriter per worker process
+
+def get_writer(args):
+    "makes (once per process) the ShardWriter this worker will append its spectrograms to"
+    global _writer
+    if _writer is None:
+        _writer = ShardWriter(args.output_path, prefix='mel', tag=os.getpid(), dtype=args.dtype, max_bytes=args.shard_size*2**20,
+                              meta={'sr':args.sr, 'n_fft':args.n_fft, 'hop_length':args.hop or args.n_fft//4, 'n_mels':args.n_mels, 'scale':args.scale})
+    return _writer
 
-    if new_filename is None:
-        print(f"ERROR: Something went wrong with name of input file {filename}. Skipping.",flush=True)
+
+def read_mel(
+    reader:ShardReader,  # reader for shards written with --format mel
+    i:int,               # item number
+    )->torch.tensor:
+    "item i as a [channels, n_mels, frames] float tensor"
+    return reader[i].view(-1, reader.meta['n_mels'], reader.recs[i]['cols'])
+
+
+def mel_up(
+    audio:torch.tensor,  # audio to turn into a spectrogram
+    name:str,            # name to store with it, e.g. its relative filename
+    args,                # output of argparse
+    ):
+    "computes mel spectrograms for all channels and appends them to this process's shard"
+    with timed('mel', audio.shape[-1]):
+        mel = mel_features(audio, sr=args.sr, n_fft=args.n_fft, hop_length=args.hop, n_mels=args.n_mels, scale=args.scale)
+    with timed('save', mel.numel()):
+        writer = get_writer(args)
+        writer.add(mel.reshape(-1, mel.shape[-1]), name)
+        writer.commit()
+
+
+def process_one_file(
+    filenames:list,      # list of filenames from which we'll pick one
+    args,                # output of argparse
+    file_ind             # index from filenames list to read from
+    ):
+    "this turns one audio file into a spectrogram.  left channel only for now"
+    filename = filenames[file_ind]  # this is actually input_path+/+filename
+    if getattr(args, 'format', 'png') == 'mel':
+        new_filename = get_new_filename(filename, args, ext='', make_dirs=False)
+        if new_filename is None: return
+        try:
+            mel_up(load_audio(filename, sr=args.sr), os.path.relpath(new_filename, args.output_path), args)
+        except Exception as e:
+            print(f"Some kind of error happened with {filename}, either loading or writing spectrograms. Skipping.", flush=True)
         return
+    new_filename = get_new_filename(filename, args)
+    if new_filename is None: return
 
     try:
         #print(f"Loading {filename}")
         audio = load_audio(filename, sr=args.sr)
         #print("audio loaded.  now calling stf_up")
-        stf_up(audio, new_filename)
+        stf_up(audio, new_filename, fast=args.fast, sr=args.sr)
     except Exception as e:
         print(f"Some kind of error happened with {filename}, either loading or writing images. Skipping.", flush=True)
 
     return
 
 
+def process_batch(
+    filenames:list,      # list of filenames from which we'll pick some
+    args,                # output of argparse
+    file_inds:list,      # indices in filenames of the files to do together
+    ):
+    "turns several audio files into spectrograms, computing all the mel spectrograms in one batch"
+    if getattr(args, 'format', 'png') == 'mel':  # nothing to gain from batching here; files have different lengths & channels
+        for i in file_inds: process_one_file(filenames, args, i)
+        return
+    audios, new_filenames = [], []
+    for i in file_inds:
+        new_filename = get_new_filename(filenames[i], args)
+        if new_filename is None: continue
+        try:
+            audios.append(load_audio(filenames[i], sr=args.sr))
+            new_filenames.append(new_filename)
+        except Exception as e:
+            print(f"Error loading {filenames[i]}. Skipping.", flush=True)
+    if len(audios) == 0: return
+    try:
+        with timed('render', sum(a.shape[-1] for a in audios)):
+            ims = audio_spectrogram_images(audios, sample_rate=args.sr)
+        for im, new_filename in zip(ims, new_filenames):
+            with timed('save'): im.save(new_filename)
+    except Exception as e:
+        print(f"Some kind of error happened writing images for {new_filenames}. Skipping.", flush=True)
+    return
+
+
+def process_task(
+    filenames:list,      # list of filenames
+    args,                # output of argparse
+    task:list,           # (file index, part, n_parts) for each file to do, as from schedule_tasks
+    ):
+    "does one scheduled task's worth of files, in batches if --batch > 1"
+    file_inds = [i for i, part, n_parts in task]
+    for j in range(0, len(file_inds), args.batch):
+        if args.batch > 1:
+            process_batch(filenames, args, file_inds[j:j+args.batch])
+        else:
+            process_one_file(filenames, args, file_inds[j])
+    save_timings()
+    return
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--sr', type=int, default=48000, help='Output sample rate')
     parser.add_argument('--workers', type=int, default=min(32, os.cpu_count() + 4), help='Maximum number of workers to use (default: all)')
+    parser.add_argument('--fast', action='store_true', help='Draw images directly instead of via matplotlib (nearly the same pixels, much faster)')
+    parser.add_argument('--batch', type=int, default=1, help='Compute spectrograms for this many files at a time (implies --fast)')
+    parser.add_argument('--format', default='png', choices=['png','mel'], help='png images, or raw mel spectrograms (all channels) in shard files')
+    parser.add_argument('--n_fft', type=int, default=1024, help='FFT size for --format mel')
+    parser.add_argument('--hop', type=int, default=None, help='Hop length for --format mel (default: n_fft//4)')
+    parser.add_argument('--n_mels', type=int, default=128, help='Number of mel bins for --format mel')
+    parser.add_argument('--scale', default='db', choices=['db','power'], help='Store log-mel (dB) or mel power values')
+    parser.add_argument('--dtype', default='float16', choices=['float16','float32'], help='Storage dtype for --format mel (float16 only with --scale db)')
+    parser.add_argument('--shard_size', type=int, default=1024, help='Approximate size of each shard file in MB')
+    parser.add_argument('--task_secs', type=float, default=300, help='Seconds of audio per task: shorter files get grouped together. 0 = one file per task, in the order found')
+    parser.add_argument('--timings', default=None, help='Directory to save timings of each stage in, and print a summary at the end')
     parser.add_argument('output_path', help='Path of output for spectrogram-ified data')
     parser.add_argument('input_paths', nargs='+', help='Path(s) of a file or a folder of files. (recursive)')
     args = parser.parse_args()
+    if args.format == 'mel' and args.scale == 'power' and args.dtype == 'float16':
+        parser.error("--scale power needs --dtype float32: mel power values overflow float16")   # fp16 tops out at 65504
 
     print(f"  output_path = {args.output_path}")
 
     print("Getting list of input filenames")
-    filenames = []
-    for path in args.input_paths:
-        for ext in ['wav','flac','ogg','aiff','aif','mp3']:
-            filenames += glob(f'{path}/**/*.{ext}', recursive=True)
+    file_index = FileIndex(args.input_paths)
+    filenames = file_index.filenames
     n = len(filenames)
     print(f"  Got {n} input filenames")
 
     print("Processing files (in parallel)")
-    wrapper = partial(process_one_file, filenames, args)
-    r = process_map(wrapper, range(0, n), chunksize=1, max_workers=args.workers)  # different chunksize used by tqdm. max_workers is to avoid annoying other ppl
+    if args.task_secs > 0:   # biggest first, small files grouped. whole files only: each one makes one image
+        tasks = schedule_tasks([estimate_duration(file_index.info[f]) for f in filenames], target=args.task_secs, split=False)
+    else:
+        tasks = [[(i, 0, 1) for i in range(j, min(j+args.batch, n))] for j in range(0, n, args.batch)]
+    if args.timings: enable_timings(args.timings, clear=True)
+    wrapper = partial(process_task, filenames, args)
+    r = process_map(wrapper, tasks, chunksize=1, max_workers=args.workers)  # workers grab the next task as soon as they're free. max_workers is to avoid annoying other ppl
+    if args.timings: print_timings(load_timings(args.timings))
 
     print("Finished")
\ No newline at end of file
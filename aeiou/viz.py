@@ -1,16 +1,13 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/viz.ipynb (unless otherwise specified).
 
 __all__ = ['embeddings_table', 'proj_pca', 'pca_point_cloud', 'print_stats', 'spectrogram_image',
-           'audio_spectrogram_image', 'tokens_spectrogram_image', 'plot_jukebox_embeddings']
+           'audio_spectrogram_image', 'get_mel_transform', 'power_to_db', 'colormap_lut', 'fast_spectrogram_image',
+           'audio_spectrogram_images', 'tokens_spectrogram_image', 'plot_jukebox_embeddings']
 
 # Cell
 import math
 from pathlib import Path
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-import matplotlib.cm as cm
-import matplotlib.pyplot as plt
-from matplotlib.colors import Normalize
-from matplotlib.figure import Figure
+from functools import lru_cache
 import numpy as np
 from PIL import Image
 
@@ -19,16 +16,15 @@ from torch import optim, nn
 from torch.nn import functional as F
 import torchaudio
 import torchaudio.transforms as T
-import librosa
 from einops import rearrange
 
-import wandb
-import numpy as np
-import pandas as pd
+# matplotlib, librosa, wandb & pandas are slow to import, so they only get imported by the functions that use them
 
 # Cell
 def embeddings_table(tokens):
     "make a table of embeddings for use with wandb"
+    import wandb
+    import pandas as pd
     features, labels = [], []
     embeddings = rearrange(tokens, 'b d n -> b n d') # each demo sample is n vectors in d-dim space
     for i in range(embeddings.size()[0]):  # nested for's are slow but sure ;-)
@@ -58,6 +54,9 @@ def proj_pca(tokens, proj_dims=3):
 # Cell
 def pca_point_cloud(tokens, color_scheme='batch'):
     "produces a 3D wandb point cloud of the tokens using PCA. tokens has shape (b, d, n)"
+    import wandb
+    import matplotlib.cm as cm
+    from matplotlib.colors import Normalize
     data = proj_pca(tokens).cpu().numpy()
     points = []
     if color_scheme=='batch':
@@ -97,6 +96,10 @@ def print_stats(waveform, sample_rate=None, src=None, print=print):
 # Cell
 def spectrogram_image(spec, title=None, ylabel='freq_bin', aspect='auto', xmax=None, db_range=[-60,20], justimage=False):
     "Modified from PyTorch tutorial https://pytorch.org/tutorials/beginner/audio_feature_extractions_tutorial.html"
+    import librosa
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
     fig = Figure(figsize=(5, 4), dpi=100) if not justimage else Figure(figsize=(4.145, 4.145), dpi=100, tight_layout=True)
     canvas = FigureCanvasAgg(fig)
     axs = fig.add_subplot()
@@ -143,8 +146,60 @@ def audio_spectrogram_image(waveform, power=2.0, sample_rate=48000, print=print,
     melspec = melspec[0] # TODO: only left channel for now
     return spectrogram_image(melspec, title="MelSpectrogram", ylabel='mel bins (log freq)', db_range=db_range, justimage=justimage)
 
+# Cell
+@lru_cache(maxsize=8)
+def get_mel_transform(sample_rate=48000, n_fft=1024, hop_length=None, n_mels=128, power=2.0):
+    "cached MelSpectrogram op, with the same settings as audio_spectrogram_image"
+    return T.MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, win_length=None,
+        hop_length=hop_length or n_fft//2, center=True, pad_mode="reflect", power=power,
+        norm='slaney', onesided=True, n_mels=n_mels, mel_scale="htk")
+
+
+def power_to_db(spec, amin=1e-10, top_db=80.0):
+    "torch version of librosa.power_to_db (with ref=1), applied to each [..., freq, time] spectrogram separately"
+    spec_db = 10*torch.log10(torch.clamp(spec, min=amin))
+    return torch.maximum(spec_db, torch.amax(spec_db, dim=(-2,-1), keepdim=True) - top_db)
+
+
+@lru_cache(maxsize=4)
+def colormap_lut(name='viridis'):
+    "[256, 4] uint8 RGBA lookup table for a matplotlib colormap"
+    import matplotlib   # the colormap registry, without loading pyplot
+    return (255*matplotlib.colormaps[name](np.arange(256))).round().astype(np.uint8)
+
+
+def fast_spectrogram_image(spec_db, db_range=[-60,20], size=(384,384), cmap='viridis'):
+    "colors a [freq, time] dB spectrogram with a lookup table, low frequencies at the bottom, like spectrogram_image(..., justimage=True)"
+    spec_db = spec_db.detach().cpu().float().numpy()   # float32, which PIL opens as a mode 'F' image
+    h, w = spec_db.shape
+    resample = Image.NEAREST if (size[0] >= 3*w and size[1] >= 3*h) else Image.BILINEAR  # roughly what matplotlib's 'antialiased' does
+    spec_db = np.asarray(Image.fromarray(spec_db[::-1].copy()).resize(size, resample=resample))
+    inds = np.clip((spec_db - db_range[0])/(db_range[1] - db_range[0])*256, 0, 255).astype(np.uint8)
+    return Image.fromarray(colormap_lut(cmap)[inds])   # [h, w, 4] uint8 -> RGBA
+
+
+def audio_spectrogram_images(
+    waveforms,            # list of [channels, samples] tensors, or one [batch, channels, samples] tensor
+    power=2.0,            # exponent for the magnitude spectrogram
+    sample_rate=48000,    # audio sample rate
+    db_range=[-60,20],    # dB values mapped to the bottom & top of the colormap
+    size=(384,384),       # image size
+    ):
+    "fast, batched version of audio_spectrogram_image(..., justimage=True): returns a list of PIL images. left channel only"
+    mel_op = get_mel_transform(sample_rate=sample_rate, power=power)
+    if not torch.is_tensor(waveforms):  # pad to the same length so they can be done as one batch, then crop each back
+        lengths = [w.shape[-1] for w in waveforms]
+        waveforms = torch.stack([F.pad(w[0].float(), (0, max(lengths) - w.shape[-1])) for w in waveforms])
+        melspecs = mel_op(waveforms)
+        melspecs = [power_to_db(m[:, :n//mel_op.hop_length + 1]) for m, n in zip(melspecs, lengths)]
+    else:
+        melspecs = power_to_db(mel_op(waveforms[:,0].float()))
+    return [fast_spectrogram_image(m, db_range=db_range, size=size) for m in melspecs]
+
 # Cell
 def tokens_spectrogram_image(tokens, aspect='auto', title='Embeddings', ylabel='index'):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
     embeddings = rearrange(tokens, 'b d n -> (b n) d')
     print(f"tokens_spectrogram_image: embeddings.shape = ",embeddings.shape)
     fig = Figure(figsize=(10, 4), dpi=100)
@@ -161,6 +216,7 @@ def tokens_spectrogram_image(tokens, aspect='auto', title='Embeddings', ylabel='
 
 # Cell
 def plot_jukebox_embeddings(zs, aspect='auto'):
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(nrows=len(zs))
     for i, z in enumerate(zs):
         #z = torch.squeeze(z)